@@ -0,0 +1,66 @@
+'''
+Benchmark of fromDesign: rows per second for design matrices of increasing size.
+
+@usage: python benchmarks/fromdesign.py [maxrows]
+'''
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from viscad import fromDesign
+from synthetic import designMatrix
+
+
+def fromDesignLoop(M):
+    """ Row by row reference implementation (previous version) """
+    dlib1 = {}
+    for j in np.arange(3,M.shape[1],2):
+        n = len( np.unique(M[:,j]) )
+        for z in np.arange(n/2,n):
+            dlib1['promoter{}_{}'.format(j+2,int(z)+1)] = None
+    dlib = {}
+    for i in np.arange(M.shape[0]):
+        plasmid = []
+        plasmid.append( 'origin{}_{}'.format(1,int(M[i,0]+1) ) )
+        plasmid.append( 'resistance{}_{}'.format(2,1) )
+        for j in np.arange(1,M.shape[1],2):
+            plasmid.append( 'promoter{}_{}'.format(j+2,int(M[i,j]+1) ) )
+            plasmid.append( 'gene{}_{}'.format(j+3,int(M[i,j]+1) ) )
+        dlib[ 'PLASMID%02d' % (i+1,) ] = plasmid
+    for p in dlib:
+        for x in dlib[p]:
+            if x not in dlib1:
+                dlib1[x] = x
+    return dlib, dlib1
+
+
+def timeit(fun, M, repeat=3):
+    best = None
+    for i in range(0, repeat):
+        t0 = time.perf_counter()
+        res = fun(M)
+        t = time.perf_counter() - t0
+        if best is None or t < best:
+            best = t
+    return best, res
+
+
+def run(maxrows=100000):
+    print('{:>10} {:>14} {:>14} {:>8}'.format('rows', 'loop rows/s', 'numpy rows/s', 'speedup'))
+    rows = 10
+    while rows <= maxrows:
+        M = designMatrix(rows)
+        t1, ref = timeit(fromDesignLoop, M)
+        t2, res = timeit(fromDesign, M)
+        assert res == ref and list(res[1]) == list(ref[1])
+        print('{:>10} {:>14.0f} {:>14.0f} {:>8.1f}'.format(rows, rows/t1, rows/t2, t1/t2))
+        rows *= 10
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,79 @@
+'''
+Cold-start budget: import time of viscad (python -X importtime) and wall time
+of a 10-construct SVG run in a fresh interpreter. Exits with an error if a
+budget is exceeded or if a PDF/pandas dependency is imported at load time.
+
+@usage: python benchmarks/importtime.py [-i ms] [-r ms]
+'''
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+from synthetic import writeLibrary
+
+# Not needed to write an SVG
+LAZY = ['reportlab', 'svglib', 'pandas', 'concurrent.futures']
+
+
+def importTime(repeat=5):
+    """ Best cumulative import time of viscad in microseconds """
+    best = None
+    for i in range(0, repeat):
+        out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import viscad'],
+                             cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True).stderr
+        for line in out.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == 'viscad':
+                t = int(fields[1])
+                if best is None or t < best:
+                    best = t
+    return best
+
+
+def eagerModules():
+    code = 'import sys, viscad; print(" ".join(m for m in {} if m in sys.modules))'.format(LAZY)
+    return subprocess.check_output([sys.executable, '-c', code], cwd=ROOT,
+                                   universal_newlines=True).split()
+
+
+def runTime(repeat=5, size=10):
+    """ Best wall time in seconds of viscad.py on a small library, without PDF """
+    tmp = tempfile.mkdtemp()
+    j0, ji0 = writeLibrary(os.path.join(tmp, 'small'), size)
+    best = None
+    for i in range(0, repeat):
+        t0 = time.perf_counter()
+        subprocess.check_call([sys.executable, os.path.join(ROOT, 'viscad.py'), j0, '-p', '--no-cache'])
+        t = time.perf_counter() - t0
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def run(args=None):
+    parser = argparse.ArgumentParser(description='viscad cold-start budget')
+    parser.add_argument('-i', type=float, default=400, help='Import time budget (ms)')
+    parser.add_argument('-r', type=float, default=1000, help='10-construct SVG run budget (ms)')
+    arg = parser.parse_args(args)
+    ok = True
+    t = importTime()/1000.0
+    print('import viscad: {:.1f} ms (budget {:.0f} ms)'.format(t, arg.i))
+    ok = ok and t <= arg.i
+    eager = eagerModules()
+    print('eager heavy modules: {}'.format(' '.join(eager) if eager else 'none'))
+    ok = ok and len(eager) == 0
+    t = runTime()*1000.0
+    print('10 constructs, SVG only: {:.1f} ms (budget {:.0f} ms)'.format(t, arg.r))
+    ok = ok and t <= arg.r
+    return ok
+
+
+if __name__ == '__main__':
+    if not run():
+        sys.exit(1)
@@ -0,0 +1,180 @@
+'''
+Stage benchmarks on synthetic libraries: wall time, CPU time and peak memory of
+each stage of viscad, from parsing to PDF. Every run is appended to a JSON lines
+history and compared with the previous run of the same configuration.
+
+@usage: python benchmarks/stages.py [-n 10 100 ...] [-g 3] [-v 3] [-o history.jsonl]
+'''
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+sys.path.insert(0, ROOT)
+import viscad
+from synthetic import writeLibrary, writeDoe, designMatrix
+
+SIZES = [10, 100, 1000, 10000, 100000]
+SOURCES = ['library', 'design']
+
+
+def stages(source, tmp, size, genes, levels, pdf):
+    """ Stages of a run as (name, function of the state) in order.
+    addNewConstruct is the layout of every construct (layoutLibrary). """
+    prefix = os.path.join(tmp, '{}{}'.format(source, size))
+    if source == 'library':
+        j0, ji0 = writeLibrary(prefix, size, genes, levels=levels)
+        doe = writeDoe(prefix, size, genes, levels=levels)
+        steps = [('readExample', lambda st: viscad.readExample(doe)),
+                 ('readLibrary', lambda st: st.update(dlib=viscad.readLibrary(j0))),
+                 ('mapLibrary', lambda st: st.update(dlib1=viscad.mapLibrary(st['dlib'], ji0)))]
+    else:
+        M = designMatrix(size, genes, levels)
+        steps = [('fromDesign', lambda st: st.update(zip(('dlib', 'dlib1'), viscad.fromDesign(M))))]
+    steps += [('addNewConstruct', layout),
+              ('render', lambda st: render(st, prefix+'.svg')),
+              ('dwg.save', lambda st: st['dwg'].save())]
+    if pdf:
+        steps.append( ('makePDF', lambda st: viscad.makePDF(prefix+'.svg', prefix+'.pdf')) )
+    return steps
+
+
+def layout(st):
+    dlib = st['dlib']
+    constructs = [(i+1, libi, dlib[libi]) for i, libi in enumerate(sorted(dlib))]
+    st['n'] = len(constructs)
+    st['table'], st['labels'] = viscad.layoutLibrary(constructs, st['dlib1'])
+
+
+def render(st, outfile):
+    """ Drawing written as by createnewCad: streamed to disk as it is rendered """
+    dwg = viscad.SvgStream(outfile)
+    viscad.addStylesheet(dwg)
+    w = viscad.renderConstructs(dwg, st['table'], st['labels'])
+    dwg.viewbox(width=w+50, height=100*(2*st['n']+2.5))
+    st['dwg'] = dwg
+
+
+def measure(steps, memory=False):
+    """ Run the stages once; wall and CPU seconds (or peak bytes) per stage """
+    res = {}
+    st = {}
+    for name, fun in steps:
+        gc.collect()
+        if memory:
+            tracemalloc.start()
+            fun(st)
+            res[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            t0 = time.perf_counter()
+            c0 = time.process_time()
+            fun(st)
+            res[name] = (time.perf_counter() - t0, time.process_time() - c0)
+    return res
+
+
+def benchmark(source, size, genes=3, levels=3, repeat=1, memory=True, pdfmax=100):
+    """ Best of repeat runs of each stage, plus the peak memory of a separate traced run """
+    tmp = tempfile.mkdtemp()
+    try:
+        steps = stages(source, tmp, size, genes, levels, size <= pdfmax)
+        best = {}
+        for i in range(0, repeat):
+            for name, t in measure(steps).items():
+                if name not in best or t[0] < best[name][0]:
+                    best[name] = t
+        peak = measure(steps, memory=True) if memory else {}
+    finally:
+        shutil.rmtree(tmp)
+    result = {}
+    for name, t in best.items():
+        result[name] = {'wall': t[0], 'cpu': t[1], 'peak': peak.get(name)}
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                                         stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.node()}
+
+
+def previous(history, record):
+    """ Last record in the history with the same configuration """
+    if not os.path.exists(history):
+        return None
+    same = ('source', 'constructs', 'genes', 'levels', 'machine')
+    last = None
+    with open(history) as h:
+        for line in h:
+            r = json.loads(line)
+            if all(r.get(k) == record[k] for k in same):
+                last = r
+    return last
+
+
+def run(args=None):
+    parser = argparse.ArgumentParser(description='viscad stage benchmarks')
+    parser.add_argument('-n', type=int, nargs='+', default=SIZES,
+                        help='Number of constructs')
+    parser.add_argument('-g', type=int, default=3,
+                        help='Number of genes (promoter/gene positions)')
+    parser.add_argument('-v', type=int, default=3,
+                        help='Number of promoter levels')
+    parser.add_argument('-s', nargs='+', default=SOURCES, choices=SOURCES,
+                        help='Source of the constructs (.j0/.ji0 library or design matrix)')
+    parser.add_argument('-k', type=int, default=1,
+                        help='Repeats (best time is kept)')
+    parser.add_argument('--pdf-max', type=int, default=100,
+                        help='Largest library converted to PDF')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Do not measure peak memory')
+    parser.add_argument('-o', default=os.path.join(HERE, 'history.jsonl'),
+                        help='History file (JSON lines)')
+    arg = parser.parse_args(args)
+    env = environment()
+    print('{:>8} {:>8} {:>16} {:>10} {:>10} {:>10} {:>8}'.format(
+        'source', 'size', 'stage', 'wall ms', 'cpu ms', 'peak MB', 'vs last'))
+    for source in arg.s:
+        for size in arg.n:
+            stats = benchmark(source, size, arg.g, arg.v, arg.k, not arg.no_memory, arg.pdf_max)
+            record = dict(env, source=source, constructs=size, genes=arg.g, levels=arg.v,
+                          stages=stats, total=sum(s['wall'] for s in stats.values()),
+                          rate=size/sum(s['wall'] for s in stats.values()))
+            last = previous(arg.o, record)
+            for name, s in stats.items():
+                ratio = ''
+                if last is not None and name in last['stages']:
+                    ratio = '{:.2f}x'.format(s['wall']/max(last['stages'][name]['wall'], 1e-9))
+                peak = '' if s['peak'] is None else '{:.1f}'.format(s['peak']/2.0**20)
+                print('{:>8} {:>8} {:>16} {:>10.1f} {:>10.1f} {:>10} {:>8}'.format(
+                    source, size, name, 1000*s['wall'], 1000*s['cpu'], peak, ratio))
+            print('{:>8} {:>8} {:>16} {:>10.1f} {:>21} {:>8}'.format(
+                source, size, 'total', 1000*record['total'],
+                '{:.0f} constructs/s'.format(record['rate']),
+                '' if last is None else '{:.2f}x'.format(record['total']/last['total'])))
+            with open(arg.o, 'a') as h:
+                h.write( json.dumps(record) + '\n' )
+
+
+if __name__ == '__main__':
+    run()
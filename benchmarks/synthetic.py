@@ -0,0 +1,61 @@
+'''
+Synthetic DoE libraries for the benchmarks: .j0/.ji0 pairs, single-file
+CSV DoE files and design matrices.
+
+@usage: python benchmarks/synthetic.py prefix size [genes] [levels]
+'''
+import csv
+import random
+import sys
+import numpy as np
+
+
+def libraryRows(size, genes=3, seed=0, levels=3):
+    """ Random constructs: part tokens and ICE ids (empty for skipped promoters) """
+    rnd = random.Random(seed)
+    for i in range(1, size+1):
+        parts = ['origin1_{}'.format(rnd.randint(1, 2)), 'resistance2_1']
+        for g in range(0, genes):
+            parts.append( 'promoter{}_{}'.format(3+2*g, rnd.randint(1, levels)) )
+            parts.append( 'gene{}_{}'.format(4+2*g, rnd.randint(1, 2)) )
+        ids = []
+        for p in parts:
+            if p.startswith('promoter') and p.endswith('_3'):
+                ids.append( '' )
+            else:
+                ids.append( 'SBC{:06d}'.format(sum(map(ord, p))) )
+        yield i, parts, ids
+
+
+def writeLibrary(prefix, size, genes=3, seed=0, levels=3):
+    """ Write the prefix.j0 (parts) and prefix.ji0 (fixed-width ICE ids) pair """
+    with open(prefix+'.j0', 'w') as h, open(prefix+'.ji0', 'w') as h2:
+        for i, parts, ids in libraryRows(size, genes, seed, levels):
+            h.write( 'SBC{:06d}\t'.format(i) + '\t'.join(parts) + '\n' )
+            h2.write( '{:>16}'.format(i) + ''.join('{:>16}'.format(x) for x in ids) + '\n' )
+    return prefix+'.j0', prefix+'.ji0'
+
+
+def writeDoe(prefix, size, genes=3, seed=0, levels=3):
+    """ Write the same library as a single CSV DoE file (construct, ICE id:part, ...) """
+    with open(prefix+'.csv', 'w', newline='') as h:
+        cw = csv.writer(h)
+        for i, parts, ids in libraryRows(size, genes, seed, levels):
+            cw.writerow( ['SBC{:06d}'.format(i)] + ['{}:{}'.format(x, p) for x, p in zip(ids, parts)] )
+    return prefix+'.csv'
+
+
+def designMatrix(rows, genes=4, levels=3, seed=0):
+    """ Random design: origin level plus promoter/gene levels per position """
+    r = np.random.RandomState(seed)
+    M = r.randint(0, levels, size=(rows, 1+2*genes)).astype(float)
+    M[:,0] = r.randint(0, 2, size=rows)
+    return M
+
+
+if __name__ == '__main__':
+    prefix, size = sys.argv[1], int(sys.argv[2])
+    genes = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    levels = int(sys.argv[4]) if len(sys.argv) > 4 else 3
+    writeLibrary(prefix, size, genes, levels=levels)
+    writeDoe(prefix, size, genes, levels=levels)
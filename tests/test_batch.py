@@ -0,0 +1,33 @@
+'''
+batch: libraries rendered again only when an output is missing or stale
+'''
+import os
+import viscad
+from synthetic import writeLibrary
+
+
+def statuses(result):
+    return dict( (os.path.basename(e['doeFile']), e['status']) for e in result['libraries'] )
+
+
+def test_outputs_of_the_options(tmp_path):
+    writeLibrary(str(tmp_path / 'lib'), 10)
+    out = str(tmp_path / 'out')
+    args = [str(tmp_path), '-O', out, '--', '-p', '--png', '--html', '--no-cache']
+    assert statuses(viscad.batch(args)) == {'lib.j0': 'ok'}
+    assert statuses(viscad.batch(args)) == {'lib.j0': 'skipped'}
+    os.remove(os.path.join(out, 'lib.png'))
+    assert statuses(viscad.batch(args)) == {'lib.j0': 'ok'}
+    assert os.path.exists(os.path.join(out, 'lib.png'))
+
+
+def test_errors_of_this_batch(tmp_path):
+    writeLibrary(str(tmp_path / 'lib'), 10)
+    (tmp_path / 'bad.j0').write_text('broken\n')
+    out = str(tmp_path / 'out')
+    assert viscad.batch([str(tmp_path), '-O', out, '--', '-p', '--no-cache'])['errors'] == 1
+    os.remove(str(tmp_path / 'bad.j0'))
+    result = viscad.batch([str(tmp_path), '-O', out, '--', '-p', '--no-cache'])
+    # The error of the previous batch is kept in the manifest only
+    assert statuses(result) == {'lib.j0': 'skipped', 'bad.j0': 'error'}
+    assert result['errors'] == 0
@@ -0,0 +1,20 @@
+'''
+LibraryCache entries saved and loaded, also when saves of the same library race
+'''
+import os
+import viscad
+from synthetic import writeLibrary
+
+
+def test_concurrent_save(tmp_path, monkeypatch):
+    j0, ji0 = writeLibrary(str(tmp_path / 'lib'), 20)
+    dlib = viscad.readLibrary(j0)
+    dlib1 = viscad.mapLibrary(dlib, ji0)
+    cache = viscad.LibraryCache(str(tmp_path / 'cache'))
+    cache.save([j0, ji0], dlib, dlib1)
+    # Another process saved the library after the existence check
+    monkeypatch.setattr(os.path, 'exists', lambda path: False)
+    cache.save([j0, ji0], dlib, dlib1)
+    monkeypatch.undo()
+    assert cache.load([j0, ji0]) == (dlib, dlib1)
+    assert os.listdir(str(tmp_path / 'cache')) == [os.path.basename(cache.folder([j0, ji0]))]
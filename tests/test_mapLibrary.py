@@ -0,0 +1,67 @@
+'''
+mapLibrary against the original parser of the fixed-width .ji0 files
+'''
+import random
+import viscad
+
+
+def baselineMap(dlib, equiv):
+    """ The character by character parser that mapLibrary replaced """
+    eqlib = {}
+    for line in open(equiv):
+        construct = []
+        line = line.rstrip()
+        ids = line.split()
+        plasmid = ids[0]
+        l = 16
+        entry = str('{:>'+str(l)+'}').format(ids[1])
+        for i in range(0, len(line)):
+            if line[i:(i+l)] == entry:
+                break
+        while i < len(line):
+            construct.append( line[i:(i+l)].rstrip().lstrip() )
+            i += l
+        for j in range(0, len(dlib[plasmid])):
+            try:
+                if construct[j] == '':
+                    construct[j] = 'None'
+                if dlib[plasmid][j] in eqlib and construct[j] == 'None':
+                    continue
+                eqlib[dlib[plasmid][j]] = construct[j]
+            except:
+                if dlib[plasmid][j] not in eqlib:
+                    eqlib[dlib[plasmid][j]] = 'None'
+    return eqlib
+
+
+def writeEquiv(path, rows):
+    with open(path, 'w') as h:
+        for plasmid, ids in rows:
+            h.write( '{:>16}'.format(plasmid) + ''.join('{:>16}'.format(x) for x in ids) + '\n' )
+
+
+def test_repeated_ids_after_blank_fields(tmp_path):
+    dlib = {'1': ['p1_1', 'p2_1', 'p3_1', 'p4_1'], '2': ['p1_1', 'p2_2', 'p3_2', 'p4_2']}
+    equiv = str(tmp_path / 'lib.ji0')
+    with open(equiv, 'w') as h:
+        h.write( '               1                          SBC003          SBC004\n' )
+        h.write( '               2          SBC003          SBC003          SBC004          SBC004\n' )
+    eqlib = viscad.mapLibrary(dlib, equiv)
+    assert eqlib == baselineMap(dlib, equiv)
+    assert eqlib['p1_1'] == 'SBC003'
+
+
+def test_random_libraries(tmp_path):
+    rnd = random.Random(0)
+    equiv = str(tmp_path / 'lib.ji0')
+    for k in range(0, 300):
+        dlib, rows = {}, []
+        for c in range(1, rnd.randint(1, 8)):
+            size = rnd.randint(1, 6)
+            dlib[str(c)] = ['p{}_{}'.format(j, rnd.randint(1, 2)) for j in range(0, size)]
+            ids = [rnd.choice(['', '', 'SBC001', 'SBC002', 'SBC003']) for j in range(0, rnd.randint(0, size+1))]
+            if not any(ids):
+                ids.append( 'SBC009' )
+            rows.append( (str(c), ids) )
+        writeEquiv(equiv, rows)
+        assert viscad.mapLibrary(dlib, equiv) == baselineMap(dlib, equiv)
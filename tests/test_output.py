@@ -0,0 +1,128 @@
+'''
+Golden output: the SVG of a library is the same, byte for byte, whatever the
+pipeline (streaming, worker processes, caches or input format)
+'''
+import io
+import os
+import pytest
+import viscad
+from synthetic import writeLibrary, libraryRows
+
+SIZE = 30
+
+
+@pytest.fixture(scope='module')
+def library(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('library')
+    return writeLibrary(str(folder / 'lib'), SIZE, 3)
+
+
+def render(doeFile, folder, name, *options):
+    """ Contents of the SVG written by viscad for the options """
+    viscad.runViscad([doeFile, '-p', '-O', str(folder), '-x', '_'+name] + list(options))
+    with open(os.path.join(str(folder), os.path.basename(doeFile).split('.')[0] + '_' + name + '.svg'), 'rb') as h:
+        return h.read()
+
+
+@pytest.fixture(scope='module')
+def golden(library, tmp_path_factory):
+    """ SVG of the default pipeline for the style options, rendered once """
+    svgs = {}
+    def get(*style):
+        if style not in svgs:
+            svgs[style] = render(library[0], tmp_path_factory.mktemp('golden'), 'golden', '--no-cache', *style)
+        return svgs[style]
+    return get
+
+
+def test_stream(library, golden, tmp_path):
+    assert render(library[0], tmp_path, 'stream', '--no-cache', '--stream') == golden()
+
+
+@pytest.mark.parametrize('options', [('--jobs', '2'), ('--stream', '--jobs', '2')])
+def test_jobs(library, golden, tmp_path, options):
+    assert render(library[0], tmp_path, 'jobs', '--no-cache', *options) == golden()
+
+
+@pytest.mark.parametrize('options', [('--stream',), ('--jobs', '2')])
+def test_symbols(library, golden, tmp_path, options):
+    svg = render(library[0], tmp_path, 'symbols', '--no-cache', '--symbols', *options)
+    assert svg == golden('--symbols')
+
+
+def test_caches(library, golden, tmp_path):
+    cache = str(tmp_path / 'cache')
+    assert render(library[0], tmp_path, 'cold', '--cache-dir', cache) == golden()
+    assert render(library[0], tmp_path, 'warm', '--cache-dir', cache) == golden()
+
+
+@pytest.mark.parametrize('options', [('--stream',), ('--jobs', '2')])
+def test_css(library, golden, tmp_path, options):
+    assert render(library[0], tmp_path, 'css', '--no-cache', '--css', *options) == golden('--css')
+
+
+def test_sheets(library, golden, tmp_path):
+    pd = pytest.importorskip('pandas')
+    rows = list(libraryRows(SIZE, 3))
+    doe = pd.DataFrame([['SBC{:06d}'.format(i)] + parts for i, parts, ids in rows])
+    ice = pd.DataFrame([[str(i)] + ids for i, parts, ids in rows])
+    doe.to_csv(str(tmp_path / 'doe.csv'), header=False, index=False)
+    ice.to_csv(str(tmp_path / 'ice.csv'), header=False, index=False)
+    assert render(str(tmp_path / 'doe.csv'), tmp_path, 'csv', '--no-cache',
+                  '-i', str(tmp_path / 'ice.csv')) == golden()
+    pytest.importorskip('openpyxl')
+    with pd.ExcelWriter(str(tmp_path / 'book.xlsx')) as w:
+        doe.to_excel(w, sheet_name='DoE', header=False, index=False)
+        ice.to_excel(w, sheet_name='ICE', header=False, index=False)
+    assert render(str(tmp_path / 'book.xlsx'), tmp_path, 'xlsx', '--no-cache') == golden()
+
+
+@pytest.mark.parametrize('options', [('--no-cache',), ()])
+def test_empty_library(tmp_path, options):
+    for ext in ('.j0', '.ji0'):
+        (tmp_path / ('empty' + ext)).write_text('')
+    svg = render(str(tmp_path / 'empty.j0'), tmp_path, 'empty', '--cache-dir', str(tmp_path / 'cache'), *options)
+    assert svg.endswith(b'<defs /></svg>')
+
+
+def test_empty_summary(tmp_path):
+    for ext in ('.j0', '.ji0'):
+        (tmp_path / ('empty' + ext)).write_text('')
+    svg = render(str(tmp_path / 'empty.j0'), tmp_path, 'summary', '--no-cache', '--summary')
+    assert b'Sample of 0 constructs' in svg
+    with pytest.raises(SystemExit):
+        render(str(tmp_path / 'empty.j0'), tmp_path, 'zero', '--no-cache', '--summary', '0')
+
+
+def test_thumbnails(library, tmp_path):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('openpyxl')
+    rows = list(libraryRows(SIZE, 3))
+    with pd.ExcelWriter(str(tmp_path / 'book.xlsx')) as w:
+        pd.DataFrame([['SBC{:06d}'.format(i)] + parts for i, parts, ids in rows]).to_excel(
+            w, sheet_name='DoE', header=False, index=False)
+        pd.DataFrame([[str(i)] + ids for i, parts, ids in rows]).to_excel(
+            w, sheet_name='ICE', header=False, index=False)
+    j0, xlsx = viscad.thumbnails([library[0], str(tmp_path / 'book.xlsx'), '-O', str(tmp_path)])
+    with open(j0, 'rb') as h1, open(xlsx, 'rb') as h2:
+        assert h1.read() == h2.read()
+
+
+def test_html_text(library, tmp_path):
+    dlib, dlib1 = viscad.readConstructs(library[0])
+    dlib['</script><!--'] = next(iter(dlib.values()))
+    constructs = [(i+1, libi, dlib[libi]) for i, libi in enumerate(sorted(dlib))]
+    table, labels = viscad.layoutLibrary(constructs, dlib1)
+    viscad.writeHtml(str(tmp_path / 'lib.html'), table, labels, title='a<b&c')
+    page = (tmp_path / 'lib.html').read_text()
+    assert '<title>a&lt;b&amp;c</title>' in page
+    assert '</script><!--' not in page
+
+
+def test_css_per_call(library, tmp_path):
+    render(library[0], tmp_path, 'css', '--no-cache', '--css')
+    dlib, dlib1 = viscad.readConstructs(library[0])
+    table, labels = viscad.layoutLibrary([(1, 'a', next(iter(dlib.values())))], dlib1)
+    dwg = viscad.SvgStream(None, body=io.StringIO())
+    viscad.renderConstructs(dwg, table, labels)
+    assert 'class=' not in dwg.body.getvalue()
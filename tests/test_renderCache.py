@@ -0,0 +1,61 @@
+'''
+RenderCache: constructs are rendered again only when they change
+'''
+import os
+import viscad
+from synthetic import writeLibrary
+
+
+def cached(folder):
+    return len([f for f in os.listdir(folder) if f.endswith('.pkl')])
+
+
+def test_edit_one_construct(tmp_path):
+    j0, ji0 = writeLibrary(str(tmp_path / 'lib'), 40, 3)
+    cache = str(tmp_path / 'cache')
+    args = [j0, '-p', '--cache-dir', cache]
+    viscad.runViscad(args)
+    assert cached(cache) == 40
+    # A new part with a new id in the fifth construct: its label is interned
+    # before those of the following constructs
+    with open(j0) as h:
+        lines = h.readlines()
+    lines[4] = lines[4].rstrip('\n') + '\tgene12_1\n'
+    with open(j0, 'w') as h:
+        h.writelines( lines )
+    with open(ji0) as h:
+        lines = h.readlines()
+    lines[4] = lines[4].rstrip('\n') + '{:>16}\n'.format('SBC999999')
+    with open(ji0, 'w') as h:
+        h.writelines( lines )
+    viscad.caches.clear()
+    viscad.runViscad(args)
+    assert cached(cache) == 41
+
+
+def folderSize(folder):
+    return sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder) if f.endswith('.pkl'))
+
+
+def test_shared_folder(tmp_path):
+    # Two processes (workers of serve or batch) using the same folder
+    folder = str(tmp_path / 'cache')
+    first, second = viscad.RenderCache(folder), viscad.RenderCache(folder)
+    entry = ('<g />', 100, [])
+    for k in range(0, 50):
+        first.put('c{}'.format(k), entry)
+    assert all('c{}'.format(k) in second for k in range(0, 50))
+    assert second.get('c0') == entry
+
+
+def test_shared_size_limit(tmp_path):
+    folder = str(tmp_path / 'cache')
+    maxsize = 32000
+    caches = [viscad.RenderCache(folder, maxsize) for k in range(0, 4)]
+    entry = ('x'*1000, 100, [])
+    for k in range(0, 200):
+        caches[k % 4].put('c{}'.format(k), entry)
+    # Each process may write maxsize/16 bytes before it checks the folder
+    assert folderSize(folder) <= maxsize + 4*(maxsize//16 + 1100)
+    # The entries used last are kept
+    assert 'c199' in caches[0]
@@ -11,46 +11,286 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 '''
 import svgwrite
 from svgwrite import cm, mm
+from svgwrite.params import Parameter
 import xml.etree.ElementTree as ET
-from reportlab.graphics import renderPDF
-from svglib.svglib import svg2rlg
 import re
 import math
+import hashlib
 import os
 import argparse
 import subprocess
 import sys
 import csv
-import pandas as pd
+import json
+import html
+import time
+import threading
+import shutil
+import tempfile
+import io
+import pickle
+import itertools
+import difflib
+import glob
+import tracemalloc
+from collections import OrderedDict
+from types import SimpleNamespace
 import numpy as np
+# reportlab, svglib, pandas and concurrent.futures are imported by the backends that need them
 
 RESISTANCE = True
 ORIGIN = True
 
 
+class Symbols:
+    """ Glyph library: each shape is defined once in <defs> and placed with <use> """
+    def __init__(self, dwg, css=False):
+        self.dwg = dwg
+        self.css = css
+        self.symbols = {}
+
+    def use(self, name, shapes, x, y, **kwargs):
+        key = (name,) + tuple(sorted(kwargs.items()))
+        if key not in self.symbols:
+            sid = name + '-' + hashlib.md5(repr(key).encode()).hexdigest()[:8]
+            s = svgwrite.container.Symbol(id=sid, overflow='visible', factory=self.dwg)
+            g = svgwrite.container.Group(factory=self.dwg, **styleAttributes(kwargs, 'p', self.css))
+            for shape in shapes:
+                g.add( svgShape(shape, 0, 0, factory=self.dwg, css=self.css) )
+            s.add( g )
+            self.dwg.defs.add( s )
+            self.symbols[key] = sid
+        return svgwrite.container.Use('#'+self.symbols[key], insert=(x, y), factory=self.dwg)
+
+
+class SvgStream:
+    """ Drawing replacement that writes each element to disk as soon as it is added.
+    Elements are not validated and are not kept in memory; the <svg> header
+    (viewbox and <defs>) is written in front of the body when saving. """
+    def __init__(self, filename, body=None):
+        self.filename = filename
+        self._parameter = Parameter(debug=False, profile='full')
+        self.defs = SvgStreamDefs()
+        self.box = None
+        if body is None:
+            body = tempfile.TemporaryFile(mode='w+', encoding='utf-8',
+                                          dir=os.path.dirname(os.path.abspath(filename)))
+        self.body = body
+
+    def add(self, element):
+        self.body.write( element.tostring() )
+
+    def write(self, fragment):
+        """ Append already serialised elements """
+        self.body.write( fragment )
+
+    def viewbox(self, minx=0, miny=0, width=0, height=0):
+        self.box = (minx, miny, width, height)
+
+    def save(self):
+        dwg = svgwrite.Drawing(debug=False)
+        if self.box is not None:
+            dwg.viewbox(*self.box)
+        xml = dwg.tostring()
+        tail = '<defs /></svg>'
+        with open(self.filename, 'w', encoding='utf-8') as h:
+            h.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+            h.write( xml[:-len(tail)] )
+            if len(self.defs.elements) > 0:
+                h.write( '<defs>' + ''.join(self.defs.elements) + '</defs>' )
+            else:
+                h.write( '<defs />' )
+            self.body.seek(0)
+            shutil.copyfileobj(self.body, h)
+            h.write( '</svg>' )
+        self.body.close()
+
+
+class SvgStreamDefs:
+    """ <defs> of a SvgStream, kept already serialised """
+    def __init__(self):
+        self.elements = []
+
+    def add(self, element):
+        if not isinstance(element, str):
+            element = element.tostring()
+        self.elements.append( element )
+
+
+class PdfCanvas:
+    """ Draw the parts straight onto a reportlab canvas, without the SVG round trip.
+    Each glyph style is drawn once as a form and placed at every occurrence. """
+    def __init__(self, filename, scale=0.75):
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.colors import toColor
+        # Same units as svg2rlg: 1px = 0.75pt
+        self.c = canvas.Canvas(filename)
+        self.toColor = toColor
+        self.scale = scale
+        self.forms = {}
+        self.height = 0
+
+    def newPage(self, height):
+        """ Parts are placed in SVG coordinates, y going down from the top """
+        self.height = height*self.scale
+        self.c.saveState()
+        self.c.translate(0, self.height)
+        self.c.scale(self.scale, -self.scale)
+
+    def endPage(self, width):
+        self.c.restoreState()
+        self.c.setPageSize( (width*self.scale, self.height) )
+        self.c.showPage()
+
+    def style(self, kwargs):
+        c = self.c
+        c.setStrokeColor( self.toColor(kwargs['stroke']) )
+        c.setLineWidth( float(kwargs['stroke_width']) )
+        c.setLineCap( 1 )
+        c.setLineJoin( 1 )
+
+    def form(self, name, shapes, kwargs):
+        key = (name,) + tuple(sorted(kwargs.items()))
+        if key not in self.forms:
+            c = self.c
+            fid = name + hashlib.md5(repr(key).encode()).hexdigest()[:8]
+            c.beginForm(fid, lowerx=-50, lowery=-50, upperx=100, uppery=100)
+            self.style(kwargs)
+            for kind, geometry, extra in shapes:
+                fill = extra.get('fill', kwargs.get('fill', '#000000'))
+                if fill != 'none':
+                    c.setFillColor( self.toColor(fill) )
+                if kind == 'circle':
+                    cx, cy, r = geometry
+                    c.circle(cx, cy, r, stroke=1, fill=int(fill != 'none'))
+                else:
+                    p = c.beginPath()
+                    for op in geometry:
+                        if op[0] == 'M':
+                            p.moveTo(op[1], op[2])
+                        elif op[0] == 'L':
+                            p.lineTo(op[1], op[2])
+                        elif op[0] == 'Z':
+                            p.close()
+                    c.drawPath(p, stroke=1, fill=int(fill != 'none'))
+            c.endForm()
+            self.forms[key] = fid
+        return self.forms[key]
+
+    def add(self, part, dy=0):
+        """ Draw the part, shifted down by dy """
+        c = self.c
+        if dy != 0:
+            c.saveState()
+            c.translate(0, dy)
+        if part.shapes is not None:
+            name, shapes, x, y = part.shapes
+            fid = self.form(name, shapes, part.kwargs)
+            c.saveState()
+            c.translate(x, y)
+            c.doForm(fid)
+            c.restoreState()
+        if part.line is not None:
+            (x1, y1), (x2, y2) = part.line
+            c.saveState()
+            self.style(part.kwargs)
+            c.line(x1, y1, x2, y2)
+            c.restoreState()
+        for text, x, y, fill, size in part.labels:
+            c.saveState()
+            c.setFillColor( self.toColor(fill) )
+            c.setFont('Helvetica', float(size))
+            c.translate(x, y)
+            c.scale(1, -1)
+            c.drawString(0, 0, text)
+            c.restoreState()
+        if dy != 0:
+            c.restoreState()
+
+    def save(self):
+        self.c.save()
+
+
 class Part:
     _partid = 0
+    _scope = ''
+    """ Default style """
+    default = {
+        'stroke': '#000000',
+        'stroke_width': '3',
+        'stroke_linecap': 'round',
+        'stroke_linejoin': 'round',
+        'font-family': 'Verdana',
+        'font-size': '16'
+        }
     def __init__(self, **kwargs):
         self.__class__._partid += 1
-        """ Default style """
-        self.kwargs = {
-            'stroke': '#000000',
-            'stroke_width': '3',
-            'stroke_linecap': 'round',
-            'stroke_linejoin': 'round',
-            'font-family': 'Verdana',
-            'font-size': '16'
-            }
+        self.symbols = kwargs.pop('symbols', None)
+        self.factory = kwargs.pop('factory', None)
+        # CSS classes of the style sheet instead of style attributes
+        self.css = kwargs.pop('css', False)
+        self.kwargs = dict(self.default)
         for key in kwargs:
             self.kwargs[key] = kwargs[key]
         self.part = []
+        self.shapes = None
+        self.labels = []
+        self.line = None
+
+    @staticmethod
+    def newScope(scope):
+        """ Restart the numbering of parts, prefixing their ids with the scope """
+        Part._scope = scope
+        for cls in [Part] + Part.__subclasses__():
+            cls._partid = 0
+
+    def glyph(self, g, name, shapes, x, y):
+        """ Add the shapes at (x, y), either inline or as a symbol instance """
+        self.shapes = (name, shapes, x, y)
+        if self.symbols is None:
+            for shape in shapes:
+                g.add( svgShape(shape, x, y, factory=self.factory, css=self.css) )
+        else:
+            g.add( self.symbols.use(name, shapes, x, y, **self.kwargs) )
+
+    def style(self):
+        """ Style attributes of the elements of the part """
+        return styleAttributes(self.kwargs, 'p', self.css)
+
+    def groupStyle(self):
+        """ Style attributes of the group of the part: none with symbols, as
+        the symbols carry the style of the glyphs and the labels their own """
+        if self.symbols is not None:
+            return {}
+        return self.style()
+
+    def label(self, g, text, x, y, **kwargs):
+        """ Add a text label; by default it is filled as the rest of the part """
+        fill = kwargs.get('fill', self.kwargs.get('fill', '#000000'))
+        size = kwargs.get('font_size', self.kwargs['font-size'])
+        if self.symbols is not None:
+            # Nothing to inherit from the group
+            kwargs = {'fill': fill, 'font-family': self.kwargs['font-family'], 'font_size': size}
+        g.add( svgwrite.text.Text(text, insert=(x, y), factory=self.factory,
+                                  **styleAttributes(dict(stroke='none', **kwargs), 'l', self.css)) )
+        self.labels.append( (text, x, y, fill, size) )
+
+
+def svgShape(shape, x, y, factory=None, css=False):
+    """ Element for a glyph shape ('path' or 'circle', geometry, attributes) shifted by (x, y) """
+    kind, geometry, extra = shape
+    extra = styleAttributes(extra, css=css)
+    if kind == 'circle':
+        cx, cy, r = geometry
+        return svgwrite.shapes.Circle( center=(x+cx, y+cy), r=r, factory=factory, **extra )
+    return svgwrite.path.Path( shiftPath(geometry, x, y), factory=factory, **extra )
 
 
 class Title(Part):
     def __init__(self, title, x=0, y=0, width=0, partid=None, **kwargs):
         Part.__init__(self, **kwargs)
         if partid is None:
-            pid = 'title' + str(self._partid)
+            pid = self._scope + 'title' + str(self._partid)
         else:
             pid = partid
         self.x = x 
@@ -59,8 +299,8 @@ class Title(Part):
         self.height = 0
         self.i = self.x
         self.o = self.x + self.width 
-        g = svgwrite.container.Group(id=pid, **self.kwargs)
-        g.add( svgwrite.text.Text(title, insert=( self.x, self.y), stroke='none', fill='#000000', font_size='24') )
+        g = svgwrite.container.Group(id=pid, factory=self.factory, **self.groupStyle())
+        self.label(g, title, self.x, self.y, fill='#000000', font_size='24')
         self.part.append( g )
         
 
@@ -74,13 +314,12 @@ class Cds(Part):
         y3 = 65
         Part.__init__(self, **kwargs)
         p1 = ( ('M', x1, y3), ('L', x2, y3), ('L', x3, y2), ('L', x2, y1), ('L', x1, y1), ('L', x1, y3), ('Z',) )
-        pd1 = shiftPath(p1, x, y-y2)
         if partid is None:
-            pid = 'cds' + str(self._partid)
+            pid = self._scope + 'cds' + str(self._partid)
         else:
             pid = partid
-        g = svgwrite.container.Group(id=pid, **self.kwargs)
-        g.add( svgwrite.path.Path( pd1 ) )
+        g = svgwrite.container.Group(id=pid, factory=self.factory, **self.groupStyle())
+        self.glyph(g, 'cds', [('path', p1, {})], x, y-y2)
         self.part.append( g )
         self.x = x + x1
         self.y = y
@@ -88,7 +327,7 @@ class Cds(Part):
         self.height = y3 - y1
         self.i = self.x
         self.o = self.x + self.width 
-        g.add( svgwrite.text.Text(pid, insert=( self.x, self.y + 40), stroke='none') )
+        self.label(g, pid, self.x, self.y + 40)
 
 
 def shiftPath(p, x, y):
@@ -109,15 +348,12 @@ class Promoter(Part):
         Part.__init__(self, **kwargs)
         p1 = ( ('M', 31.5, 15.5), ('L', 40, 23), ('L', 31.5, 30.333) )
         p2 = ( ('M', 10, 50), ('L', 10, 23), ('L', 39, 23) )
-        pd1 = shiftPath(p1, x, y-50)
-        pd2 = shiftPath(p2, x, y-50)
         if partid is None:
-            pid = 'prom' + str(self._partid)
+            pid = self._scope + 'prom' + str(self._partid)
         else:
             pid = partid
-        g = svgwrite.container.Group(id=pid, **self.kwargs)
-        g.add( svgwrite.path.Path( pd1, fill='none') )
-        g.add( svgwrite.path.Path( pd2, fill='none') )
+        g = svgwrite.container.Group(id=pid, factory=self.factory, **self.groupStyle())
+        self.glyph(g, 'prom', [('path', p1, {'fill': 'none'}), ('path', p2, {'fill': 'none'})], x, y-50)
         self.part.append( g )
         self.x = x 
         self.y = y 
@@ -125,7 +361,7 @@ class Promoter(Part):
         self.height = 50 - 15.5
         self.i = self.x
         self.o = self.x #+ self.width 
-        g.add( svgwrite.text.Text(pid, insert=( self.x, self.y + 40), stroke='none', fill=self.kwargs['stroke']) )
+        self.label(g, pid, self.x, self.y + 40, fill=self.kwargs['stroke'])
 
 
 class connect(Part):
@@ -133,10 +369,15 @@ class connect(Part):
         Part.__init__(self, **kwargs)
         start = (part1.o, part1.y)
         end = (part2.i, part2.y)
-        pid = 'line' + str(self._partid)
+        pid = self._scope + 'line' + str(self._partid)
+        self.line = (start, end)
+        style = self.kwargs
+        if self.symbols is not None:
+            # A line has no text, so the fonts are only needed by the groups
+            style = {k: v for k, v in style.items() if not k.startswith('font')}
         self.part = [svgwrite.shapes.Line(start=start, end=end,
-                                         id=pid,
-                                         **self.kwargs
+                                         id=pid, factory=self.factory,
+                                         **styleAttributes(style, 'p', self.css)
                                      )]
         self.x = start[0] 
         self.y = start[1]
@@ -152,12 +393,9 @@ class Terminator(Part):
         Part.__init__(self, **kwargs)
         p1 = ( ('M', 25, 50), ('L', 25, 26) )
         p2 = ( ('M', 10, 25), ('L', 40, 25) )
-        pd1 = shiftPath(p1, x, y-50)
-        pd2 = shiftPath(p2, x, y-50)
-        pid = 'term' + str(self._partid)
-        g = svgwrite.container.Group(id=pid, **self.kwargs)
-        g.add( svgwrite.path.Path( pd1, fill='none') )
-        g.add( svgwrite.path.Path( pd2, fill='none') )
+        pid = self._scope + 'term' + str(self._partid)
+        g = svgwrite.container.Group(id=pid, factory=self.factory, **self.groupStyle())
+        self.glyph(g, 'term', [('path', p1, {'fill': 'none'}), ('path', p2, {'fill': 'none'})], x, y-50)
         self.part.append( g )
         self.x = x + 40
         self.y = y 
@@ -173,11 +411,11 @@ class Origin(Part):
         Part.__init__(self, **kwargs)
         self.part = []
         if partid is None:
-            pid = 'prom' + str(self._partid)
+            pid = self._scope + 'prom' + str(self._partid)
         else:
             pid = partid
-        g = svgwrite.container.Group(id=pid, **self.kwargs)
-        g.add( svgwrite.shapes.Circle( center=(x+12,y), r=12) )
+        g = svgwrite.container.Group(id=pid, factory=self.factory, **self.groupStyle())
+        self.glyph(g, 'ori', [('circle', (12, 50, 12), {})], x, y-50)
         self.part.append( g )
         self.x = x
         self.y = y
@@ -185,7 +423,7 @@ class Origin(Part):
         self.height = 24
         self.i = self.x
         self.o = self.x + self.width
-        g.add( svgwrite.text.Text(pid, insert=( self.x-50, self.y + 40), stroke='none', fill=self.kwargs['stroke']) )
+        self.label(g, pid, self.x-50, self.y + 40, fill=self.kwargs['stroke'])
 
 
 class Rbs:
@@ -232,10 +470,9 @@ def readExample(f, f2=None, v2=True):
         if os.path.exists(f2):
             with open(f2) as handler:
                 for row in handler:
-                    line = row.rstrip()
                     ll = []
-                    for i in range(0, len(line), 16):
-                        pid = re.sub('\s', '', line[i:min(i+16, len(line))])
+                    for pid in fixedFields(row.rstrip()):
+                        pid = ''.join(pid.split())
                         if len(pid) == 0:
                             ll.append( None )
                         else:
@@ -258,9 +495,9 @@ def readExample(f, f2=None, v2=True):
                             y = None
                         if x.startswith( 'promoter' ):
                             a, b = x.split( '_' )
-                            if re.search( '.*(\d+)', a):
+                            if re.search( r'.*(\d+)', a):
                                 # promoter number
-                                v = re.search( '[^\d]*(\d+)$', a).groups()[0]
+                                v = re.search( r'[^\d]*(\d+)$', a).groups()[0]
                                 if int(v) > 3 and int(b) >=3:
                                     y = None
                                     j -= 1
@@ -273,92 +510,302 @@ def readExample(f, f2=None, v2=True):
 
             
 
-def addNewConstruct(dwg, constructIdentifier, construct, base, cell, slot, dlibid, cmap={}, cv=False):
-    """ Mapping improvement. """
-    parts = []
-    colors = ['red', 'blue', 'green', 'chartreuse', 'magenta', 'grey', 'cyan', 'darksalmon', 'lavender', 'orange']
+# Part types of the layout table
+PTITLE, PPROMOTER, PCDS, PORIGIN, PTERMINATOR, PLINE = range(6)
+
+COLORS = ['red', 'blue', 'green', 'chartreuse', 'magenta', 'grey', 'cyan', 'darksalmon', 'lavender', 'orange']
+
+# Style sheet of the CSS classes: the default style of the parts (p), the
+# labels (l), and the fill (f-), stroke (s-) and font size (z-) values
+STYLEBASE = {'p': Part.default, 'l': {'stroke': 'none'}}
+STYLEPREFIX = {'fill': 'f', 'stroke': 's', 'font_size': 'z', 'font-size': 'z'}
+STYLEVALUES = {'f': COLORS + ['#000000', 'none'], 's': COLORS + ['#000000', 'none'], 'z': ['16', '24']}
+
+
+def styleClass(key, value):
+    """ Class of the style sheet setting the attribute, if any """
+    prefix = STYLEPREFIX.get(key)
+    if prefix is None or value not in STYLEVALUES[prefix]:
+        return None
+    return '{}-{}'.format(prefix, 'black' if value == '#000000' else value)
+
+
+def styleAttributes(kwargs, base=None, css=False):
+    """ Style attributes of an element; with css, the attributes set by the
+    base class or by a class of the style sheet are replaced by the classes """
+    if not css:
+        return kwargs
+    names = [] if base is None else [base]
+    attributes = {}
+    for key, value in kwargs.items():
+        if STYLEBASE.get(base, {}).get(key) == value:
+            continue
+        name = styleClass(key, value)
+        if name is None:
+            attributes[key] = value
+        else:
+            names.append( name )
+    if len(names) > 0:
+        attributes['class_'] = ' '.join(names)
+    return attributes
+
+
+def stylesheet():
+    """ Rules of the CSS classes """
+    def declarations(style):
+        return ';'.join('{}:{}{}'.format(key.replace('_', '-'), value,
+                                         'px' if key in ('font_size', 'font-size') else '')
+                        for key, value in style.items())
+    rules = ['.{}{{{}}}'.format(base, declarations(style)) for base, style in STYLEBASE.items()]
+    for key, prefix in (('fill', 'f'), ('stroke', 's'), ('font_size', 'z')):
+        for value in STYLEVALUES[prefix]:
+            rules.append( '.{}{{{}}}'.format(styleClass(key, value), declarations({key: value})) )
+    return '\n'.join(rules)
+
+
+def addStylesheet(dwg, css=False):
+    """ Define the CSS classes in the drawing, if they are used (css) """
+    if css:
+        dwg.defs.add( svgwrite.container.Style(stylesheet(), factory=dwg) )
+
+
+# One row per part: position of the construct, part type, start and end
+# points, index in COLORS (-1: default style) and index of the label
+LAYOUT = np.dtype([('construct', 'i4'), ('type', 'u1'), ('x', 'f8'), ('y', 'f8'),
+                   ('x2', 'f8'), ('y2', 'f8'), ('color', 'i2'), ('label', 'i4')])
+
+
+class Labels:
+    """ Interned label texts of a layout table """
+    def __init__(self):
+        self.index = {}
+        self.text = []
+
+    def add(self, text):
+        if text not in self.index:
+            self.index[text] = len(self.text)
+            self.text.append( text )
+        return self.index[text]
+
+    def __getitem__(self, i):
+        return self.text[i]
+
+
+def colorIndex(k):
+    """ Index in COLORS, negative values counting from the end as in a list """
+    return range(len(COLORS))[k]
+
+
+# Kinds of the part tokens ('promoter5_2': kind, position number and level)
+KPLASMID, KORIGIN, KRESISTANCE, KPROMOTER, KGENE, KOTHER = range(6)
+KINDS = {'plasmid': KPLASMID, 'origin': KORIGIN, 'resistance': KRESISTANCE,
+         'promoter': KPROMOTER, 'gene': KGENE}
+
+
+class PartIndex:
+    """ Interned part tokens of a library: each distinct token is decoded once,
+    when first looked up, into (kind, position, level, index in COLORS, ICE
+    number in dlib1), or None if it is not in dlib1. Parts with no ICE number
+    have None. cv selects the colours of the genes as in addNewConstruct. """
+    def __init__(self, dlib1, cv=False):
+        self.dlib1 = dlib1
+        self.cv = cv
+        self.codes = {}
+
+    def __getitem__(self, token):
+        try:
+            return self.codes[token]
+        except KeyError:
+            code = self.codes[token] = self.decode(token)
+            return code
+
+    def __len__(self):
+        return len(self.codes)
+
+    def decode(self, token):
+        try:
+            partid = self.dlib1[token]
+        except:
+            return None
+        x = token.split('_')
+        level = int(x[-1])
+        w = re.split('([0-9]+)$', x[0])
+        kind = KINDS.get(w[0], KOTHER)
+        pnum = int( math.floor( int(w[1]) / 2 )  - 2 )
+        if partid is None or partid == 'None':
+            return (kind, pnum, level, -1, None)
+        if kind in (KORIGIN, KPROMOTER):
+            color = colorIndex(level - 1)
+        elif kind == KRESISTANCE:
+            color = colorIndex(pnum)
+        elif kind == KGENE and self.cv:
+            color = (pnum + level - 1 ) % len(COLORS)
+        elif kind == KGENE:
+            color = colorIndex(pnum)
+        else:
+            color = -1
+        return (kind, pnum, level, color, partid)
+
+
+def ports(row):
+    """ Input and output x of a laid out part """
+    t, x, x2 = row[1], row[2], row[4]
+    if t == PCDS:
+        return x + 9, x + 42
+    if t == PTERMINATOR:
+        return x + 40, x + 40
+    if t == PORIGIN:
+        return x, x + 24
+    if t == PPROMOTER:
+        return x, x
+    return x, x2
+
+
+def line(row1, row2):
+    """ Row of the line connecting two parts """
+    return (row1[0], PLINE, ports(row1)[1], row1[3], ports(row2)[0], row2[3], -1, -1)
+
+
+def addNewConstruct(constructIdentifier, construct, base, cell, slot, dlibid, cv=False, labels=None, pos=0,
+                    drawn=None, index=None):
+    """ Mapping improvement. Lay out the construct as rows of the layout table;
+    the texts of the title and the parts are added to labels. If drawn is
+    given, the row of each drawn part is recorded there by part index. The
+    parts are looked up in index, the PartIndex of dlibid and cv, if given. """
+    if labels is None:
+        labels = Labels()
+    if index is None:
+        index = PartIndex(dlibid, cv)
+    rows = []
     cid = constructIdentifier
     if cid in dlibid:
         cid = dlibid[cid]
-    title = Title( cid, cell, base+0.5*slot, cell )
-    parts.append( title )
+    rows.append( (pos, PTITLE, cell, base+0.5*slot, cell+cell, 0, -1, labels.add(cid)) )
     base += slot
     cursor = 1
     for i in range(0, len(construct)):
-        try:
-            partid = dlibid[ construct[i] ]
-        except:
+        start = len(rows)
+        code = index[ construct[i] ]
+        if code is None:
             continue
-        x = construct[i].split('_')
-        level = int(x[-1])
-        w = re.split('([0-9]+)$', x[0])
-        ptype = w[0]
-        pnum = int( math.floor( int(w[1]) / 2 )  - 2 )
-        if partid is None or partid == 'None':
-            if ptype == 'promoter':
+        kind, pnum, level, pcolor, partid = code
+        if partid is None:
+            if kind == KPROMOTER:
                 cursor += 4
             else:
                 cursor += 2
             continue
-        if ptype == 'plasmid':
-            prom1 = Promoter(x=len(parts)*cell, y=base, partid=partid)
-            parts.append( prom1 )
+        if kind == KPLASMID:
+            rows.append( (pos, PPROMOTER, len(rows)*cell, base, 0, 0, -1, labels.add(partid)) )
             cursor += 1
 
-        if ptype == 'origin' and ORIGIN:
-            pcolor = colors [ level - 1]
-            ori1 = Origin(x=cursor*cell, y=base, partid=partid, fill=pcolor)
-            parts.append( ori1 )
+        elif kind == KORIGIN and ORIGIN:
+            rows.append( (pos, PORIGIN, cursor*cell, base, 0, 0, pcolor, labels.add(partid)) )
             cursor += 2
 
-        if ptype == 'resistance' and RESISTANCE:
-
-            pcolor = colors[ pnum ]
-            cds1 = Cds(x=cursor*cell, y=base, partid=partid, fill=pcolor)
-            conn1 = connect(parts[-1], cds1)
-            parts.append(conn1)
-            parts.append(cds1)
+        elif kind == KRESISTANCE and RESISTANCE:
+            cds1 = (pos, PCDS, cursor*cell, base, 0, 0, pcolor, labels.add(partid))
+            rows.append( line(rows[-1], cds1) )
+            rows.append( cds1 )
             cursor += 2
-           
-
-        if ptype == 'promoter':
-            pcolor = colors[ level - 1 ]
 
-            if len(parts) > 1:
-                term1 = Terminator(x=cursor*cell, y=base, stroke=pcolor)
-                conn1 = connect(parts[-1], term1)
-                parts.append(conn1)
-                parts.append(term1)
+        elif kind == KPROMOTER:
+            if len(rows) > 1:
+                term1 = (pos, PTERMINATOR, cursor*cell, base, 0, 0, pcolor, -1)
+                rows.append( line(rows[-1], term1) )
+                rows.append( term1 )
                 cursor += 2
 
-            prom1 = Promoter(x=cursor*cell, y=base, partid=partid, stroke=pcolor)
-            if len(parts) >= 1:
-                conn1 = connect(parts[-1], prom1)
-                parts.append(conn1)
-                parts.append(prom1)
-                cursor += 2
-            else:
-                parts.append(prom1)
-                cursor += 2
+            prom1 = (pos, PPROMOTER, cursor*cell, base, 0, 0, pcolor, labels.add(partid))
+            rows.append( line(rows[-1], prom1) )
+            rows.append( prom1 )
+            cursor += 2
 
-        if ptype == 'gene':
-#            if partid in cmap:
-#            pcolor = colors[ cmap[partid] % len(colors) ]
-#            else:
-            if cv:
-                pcolor = colors[ (pnum + level - 1 ) % len(colors)]
-            else:
-                pcolor = colors[ pnum ]
-            cds1 = Cds(x=cursor*cell, y=base, partid=partid, fill=pcolor)
-            conn1 = connect(parts[-1], cds1)
-            parts.append(conn1)
-            parts.append(cds1)
+        elif kind == KGENE:
+            cds1 = (pos, PCDS, cursor*cell, base, 0, 0, pcolor, labels.add(partid))
+            rows.append( line(rows[-1], cds1) )
+            rows.append( cds1 )
             cursor += 2
 
-    term1 = Terminator(x=cursor*cell, y=base)
-    conn1 = connect(parts[-1], term1)
-    parts.append(term1)
-    parts.append(conn1)
+        if drawn is not None and len(rows) > start:
+            drawn[i] = len(rows) - 1
+
+    term1 = (pos, PTERMINATOR, cursor*cell, base, 0, 0, -1, -1)
+    conn1 = line(rows[-1], term1)
+    rows.append( term1 )
+    rows.append( conn1 )
+    return rows
+
+
+def layoutLibrary(constructs, dlib1, cv=False, cell=50, slot=100, index=None):
+    """ Layout table of the (position, identifier, construct) entries and its
+    labels; index is the PartIndex of dlib1 and cv, built here if not given """
+    labels = Labels()
+    if index is None:
+        index = PartIndex(dlib1, cv)
+    rows = []
+    for i, libi, construct in constructs:
+        try:
+            constructid = dlib1[libi]
+        except:
+            constructid = libi
+        rows.extend( addNewConstruct(constructid, construct, base=(2*i+0.5)*slot, cell=cell, slot=slot,
+                                     dlibid=dlib1, cv=cv, labels=labels, pos=i, index=index) )
+    return np.array(rows, dtype=LAYOUT), labels
+
+
+def splitLayout(table):
+    """ Rows of each construct in the layout table """
+    if len(table) == 0:
+        return []
+    starts = np.flatnonzero( np.diff(table['construct']) ) + 1
+    return np.split(table, starts)
+
+
+def layoutWidth(table, cell=50):
+    """ End of the widest construct: its last row is the closing line """
+    if len(table) == 0:
+        return cell
+    last = np.append( np.flatnonzero( np.diff(table['construct']) ), len(table)-1 )
+    return max(cell, coord( table['x2'][last].max().item() ))
+
+
+def coord(v):
+    """ Table coordinates are floats; x values are integers in the drawing """
+    if v == int(v):
+        return int(v)
+    return v
+
+
+def layoutParts(rows, labels, factory=None, symbols=None, css=False):
+    """ Build the parts of the rows of the layout table """
+    if isinstance(rows, np.ndarray):
+        rows = rows.tolist()
+    parts = []
+    for pos, t, x, y, x2, y2, color, label in rows:
+        x = coord(x)
+        kwargs = {'factory': factory, 'symbols': symbols, 'css': css}
+        if t == PTITLE:
+            parts.append( Title(labels[label], x, y, coord(x2) - x, **kwargs) )
+            continue
+        if t == PLINE:
+            start = SimpleNamespace(o=x, y=y)
+            end = SimpleNamespace(i=coord(x2), y=y2)
+            parts.append( connect(start, end, **kwargs) )
+            continue
+        if color >= 0:
+            if t in (PCDS, PORIGIN):
+                kwargs['fill'] = COLORS[color]
+            else:
+                kwargs['stroke'] = COLORS[color]
+        if t == PPROMOTER:
+            parts.append( Promoter(x=x, y=y, partid=labels[label], **kwargs) )
+        elif t == PCDS:
+            parts.append( Cds(x=x, y=y, partid=labels[label], **kwargs) )
+        elif t == PORIGIN:
+            parts.append( Origin(x=x, y=y, partid=labels[label], **kwargs) )
+        elif t == PTERMINATOR:
+            parts.append( Terminator(x=x, y=y, **kwargs) )
     return parts
 
 
@@ -378,148 +825,2050 @@ def mapnewParts(dlib, dlibid):
     return cmap
 
 
-def fromDesign(M):
-    dlib1 = {}
-    df = pd.DataFrame(M)
-    for j in np.arange(3,df.shape[1],2):
-        n = len( df.iloc[:,j].unique() )
-        for z in np.arange(n/2,n):
-            dlib1['promoter{}_{}'.format(j+2,int(z)+1)] = None
-    dlib = {}
-    for i in np.arange(M.shape[0]):
-        plasmid = []
-        plasmid.append( 'origin{}_{}'.format(1,int(M[i,0]+1) ) )
-        plasmid.append( 'resistance{}_{}'.format(2,1) )
-        for j in np.arange(1,M.shape[1],2):
-            plasmid.append( 'promoter{}_{}'.format(j+2,int(M[i,j]+1) ) )
-            plasmid.append( 'gene{}_{}'.format(j+3,int(M[i,j]+1) ) )
-        dlib[ 'PLASMID%02d' % (i+1,) ] = plasmid
-    for p in dlib:
-        for x in dlib[p]:
-            if x not in dlib1:
-                dlib1[x] = x
+def levelTokens(fmt, column):
+    """ Format the token of each distinct level once and broadcast it to the rows.
+    Returns the token per row and the first row where each token appears. """
+    levels = (column + 1).astype(int)
+    u, first, inv = np.unique(levels, return_index=True, return_inverse=True)
+    table = np.array([fmt.format(v) for v in u], dtype=object)
+    return table[inv.ravel()], table, first
+
+
+def fromDesign(M, rows=None, absent=None):
+    """ Build the library from a design matrix, column by column. If rows are
+    given, only those rows are built (the absent promoters still depend on
+    the whole design; absent, the dlib1 of no rows, saves computing them). """
+    M = np.asarray(M)
+    if absent is not None:
+        dlib1 = dict(absent)
+    else:
+        dlib1 = {}
+        for j in np.arange(3,M.shape[1],2):
+            n = len( np.unique(M[:,j]) )
+            for z in np.arange(n/2,n):
+                dlib1['promoter{}_{}'.format(j+2,int(z)+1)] = None
+    if rows is None:
+        rows = np.arange(M.shape[0])
+    else:
+        rows = np.asarray(rows, dtype=int)
+        M = M[rows]
+    n = M.shape[0]
+    columns = [ levelTokens('origin{}_{{}}'.format(1), M[:,0]),
+                levelTokens('resistance{}_{{}}'.format(2), np.zeros(n)) ]
+    for j in np.arange(1,M.shape[1],2):
+        columns.append( levelTokens('promoter{}_{{}}'.format(j+2), M[:,j]) )
+        columns.append( levelTokens('gene{}_{{}}'.format(j+3), M[:,j]) )
+    tokens = np.empty( (n, len(columns)), dtype=object )
+    seen = []
+    for c in range(0, len(columns)):
+        tokens[:,c], table, first = columns[c]
+        seen.extend( zip(first, [c]*len(first), table) )
+    names = np.char.mod('PLASMID%02d', rows+1)
+    dlib = dict( zip(names.tolist(), tokens.tolist()) )
+    # Same insertion order as a row by row scan of the library
+    for first, c, x in sorted(seen):
+        if x not in dlib1:
+            dlib1[x] = x
     return dlib, dlib1
     
         
              
-def createnewCad(f1=None, f2=None, outfile=None, v2=True, M=None, colvariants=False):
+def renderConstructs(dwg, table, labels, symbols=None, cell=50, pdf=None, css=False):
+    """ Render the constructs of the layout table into the drawing
+    (and the PDF canvas, if any). Returns the width of the widest construct. """
+    for rows in splitLayout(table):
+        Part.newScope('c{}_'.format(rows['construct'][0]))
+        for pc in layoutParts(rows, labels, factory=dwg, symbols=symbols, css=css):
+            for p in pc.part:
+                dwg.add( p )
+            if pdf is not None:
+                pdf.add( pc )
+    return layoutWidth(table, cell)
+
+
+def renderDesigns(dwg, constructs, table, labels, symbols=None, cell=50, slot=100, pdf=None, css=False):
+    """ Render each distinct part sequence once as a group in <defs> and place it
+    with <use> under the title of every construct that shares it.
+    Returns the width of the widest design. """
+    designs = {}
+    for (i, libi, construct), rows in zip(constructs, splitLayout(table)):
+        key = tuple(construct)
+        if key not in designs:
+            d = len(designs) + 1
+            Part.newScope('d{}_'.format(d))
+            # Moved to the first slot, the title is left out
+            drows = rows[1:].copy()
+            drows['y'] -= 2*i*slot
+            drows['y2'][drows['type'] == PLINE] -= 2*i*slot
+            parts = layoutParts(drows, labels, factory=dwg, symbols=symbols, css=css)
+            g = svgwrite.container.Group(id='design{}'.format(d), factory=dwg)
+            for pc in parts:
+                for p in pc.part:
+                    g.add( p )
+            dwg.defs.add( g )
+            designs[key] = (d, parts)
+        d, parts = designs[key]
+        Part.newScope('c{}_'.format(i))
+        title = layoutParts(rows[:1], labels, factory=dwg, symbols=symbols, css=css)[0]
+        for p in title.part:
+            dwg.add( p )
+        dwg.add( svgwrite.container.Use('#design{}'.format(d), insert=(0, 2*i*slot), factory=dwg) )
+        if pdf is not None:
+            pdf.add( title )
+            for pc in parts:
+                pdf.add( pc, dy=2*i*slot )
+    return layoutWidth(table, cell)
+
+
+def uniqueDesigns(dlib, dlib1):
+    """ Group the constructs with the same part sequence: one entry per design,
+    titled by its first construct and the number of constructs. """
+    designs = OrderedDict()
+    for libi in sorted(dlib):
+        key = tuple(dlib[libi])
+        if key not in designs:
+            designs[key] = []
+        try:
+            designs[key].append( dlib1[libi] )
+        except:
+            designs[key].append( libi )
+    return [('{} (x{})'.format(designs[key][0], len(designs[key])), list(key)) for key in designs]
+
+
+def cacheFolder():
+    """ Default folder of the caches """
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'viscad')
+
+
+def codeVersion():
+    """ Hash of this file """
+    with open(os.path.abspath(__file__), 'rb') as h:
+        return hashlib.sha1(h.read()).hexdigest()
+
+
+class RenderCache:
+    """ On-disk cache of rendered construct fragments, addressed by the hash of
+    everything that determines the fragment. The files are the state of the
+    cache, shared by all the processes that use the folder. Least recently
+    used entries are evicted when the folder grows above maxsize bytes, which
+    is checked after every maxsize/16 bytes written by a process. """
+    def __init__(self, path=None, maxsize=500*2**20):
+        if path is None:
+            path = cacheFolder()
+        self.path = path
+        self.maxsize = maxsize
+        # Any change of the code invalidates the cache
+        self.version = codeVersion()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.written = 0
+        self.evict()
+
+    def key(self, rows, labels, *options):
+        """ Hash of the layout rows of a construct and their labels. The label
+        texts are hashed instead of their indices, which depend on the rest of
+        the library. """
+        h = hashlib.sha1( self.version.encode() )
+        for name in rows.dtype.names:
+            if name != 'label':
+                h.update( np.ascontiguousarray(rows[name]).tobytes() )
+        h.update( repr( [labels[l] if l >= 0 else None for l in rows['label'].tolist()] ).encode() )
+        h.update( repr( options ).encode() )
+        return h.hexdigest()
+
+    def file(self, key):
+        return os.path.join(self.path, key+'.pkl')
+
+    def __contains__(self, key):
+        return os.path.exists( self.file(key) )
+
+    def get(self, key):
+        fname = self.file(key)
+        try:
+            with open(fname, 'rb') as h:
+                entry = pickle.load(h)
+            os.utime(fname)
+        except Exception:
+            return None
+        return entry
+
+    def put(self, key, entry):
+        fname = self.file(key)
+        tmp = '{}.{}.tmp'.format(fname, os.getpid())
+        with open(tmp, 'wb') as h:
+            pickle.dump(entry, h, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, fname)
+        self.written += os.path.getsize(fname)
+        if self.written > self.maxsize // 16:
+            self.evict()
+
+    def evict(self):
+        """ Remove the least recently used entries of the folder above the size limit """
+        self.written = 0
+        entries = []
+        for e in os.scandir(self.path):
+            if e.name.endswith('.pkl'):
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                entries.append( (st.st_mtime, e.path, st.st_size) )
+        entries.sort()
+        size = sum(e[2] for e in entries)
+        for mtime, fname, fsize in entries[:-1]:
+            if size <= self.maxsize:
+                break
+            size -= fsize
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+
+def renderFragments(tables, labels, symbols=False, css=False):
+    """ Render the layout rows of each construct on their own into an SVG fragment.
+    Returns a (fragment, width, symbol definitions) entry per construct. """
+    entries = []
+    for rows in tables:
+        dwg = SvgStream(None, body=io.StringIO())
+        if symbols:
+            sym = Symbols(dwg, css)
+        else:
+            sym = None
+        w = renderConstructs(dwg, rows, labels, symbols=sym, css=css)
+        if sym is None:
+            defs = []
+        else:
+            defs = list( zip(sym.symbols, dwg.defs.elements) )
+        entries.append( (dwg.body.getvalue(), w, defs) )
+    return entries
+
+
+worker = {}
+
+def initWorker(labels, symbols, css=False):
+    """ Shared state of the rendering processes """
+    worker.update( {'labels': labels, 'symbols': symbols, 'css': css} )
+
+
+def renderChunk(tables, labels=None):
+    """ Render a chunk of constructs in a worker process, with the labels of
+    the worker unless they are given """
+    if labels is None:
+        labels = worker['labels']
+    return renderFragments(tables, labels, symbols=worker['symbols'], css=worker['css'])
+
+
+def writeFragments(dwg, tables, labels, symbols=False, pool=None, jobs=1, cache=None, seen=None, cell=50,
+                   send=False, css=False):
+    """ Write the constructs (their layout rows) to the SvgStream as fragments
+    taken from the cache or rendered, by the worker pool if any (with send,
+    the labels go with the chunks instead of being those of the workers).
+    seen holds the symbols already defined. Returns the width of the widest
+    construct. """
+    if seen is None:
+        seen = set()
+    if cache is not None:
+        keys = [cache.key(rows, labels, bool(symbols), css) for rows in tables]
+        missing = [k for k in range(0, len(tables)) if keys[k] not in cache]
+    else:
+        keys = None
+        missing = list(range(0, len(tables)))
+    todo = [tables[k] for k in missing]
+    if pool is not None:
+        # Chunks are rendered in worker processes and returned in order
+        chunk = max(1, int(math.ceil( len(todo) / (4.0*jobs) )))
+        chunks = [todo[k:(k+chunk)] for k in range(0, len(todo), chunk)]
+        if send:
+            rendered = pool.map(renderChunk, chunks, [labels]*len(chunks))
+        else:
+            rendered = pool.map(renderChunk, chunks)
+        rendered = itertools.chain.from_iterable( rendered )
+    else:
+        rendered = (e for rows in todo for e in renderFragments([rows], labels, symbols, css))
+    missing = set(missing)
+    w = cell
+    for k in range(0, len(tables)):
+        if k in missing:
+            entry = next(rendered)
+            if cache is not None:
+                cache.put(keys[k], entry)
+        else:
+            entry = cache.get(keys[k])
+            if entry is None:
+                entry = renderFragments([tables[k]], labels, symbols, css)[0]
+        fragment, w1, defs = entry
+        for key, d in defs:
+            if key not in seen:
+                seen.add( key )
+                dwg.defs.add( d )
+        dwg.write( fragment )
+        w = max(w, w1)
+    return w
+
+
+def writeSvg(outfile, constructs, table, labels, symbols=False, stream=False, pool=None,
+             jobs=1, cell=50, slot=100, pdf=None, cache=None, dedup=False, css=False):
+    """ Write the laid out constructs to a single SVG, either directly or as fragments
+    taken from the cache or rendered by the worker pool. If a PdfCanvas is
+    given, the constructs are also drawn on a new page (in this process).
+    With dedup, identical constructs are drawn once and referenced. """
+    i = len(constructs) + 1
+    if pdf is not None:
+        pdf.newPage( slot*(2*i+0.5) )
+    if pdf is None and not dedup and (pool is not None or cache is not None):
+        dwg = SvgStream(outfile)
+        addStylesheet(dwg, css)
+        w = writeFragments(dwg, splitLayout(table), labels, symbols, pool=pool, jobs=jobs,
+                           cache=cache, cell=cell, css=css)
+    else:
+        if stream:
+            dwg = SvgStream(outfile)
+        else:
+            dwg = svgwrite.Drawing(filename=outfile, debug=True)
+        addStylesheet(dwg, css)
+        if symbols:
+            symbols = Symbols(dwg, css)
+        else:
+            symbols = None
+        if dedup:
+            w = renderDesigns(dwg, constructs, table, labels, symbols=symbols,
+                              cell=cell, slot=slot, pdf=pdf, css=css)
+        else:
+            w = renderConstructs(dwg, table, labels, symbols=symbols, cell=cell, pdf=pdf, css=css)
+    dwg.viewbox(width=w+cell, height=slot*(2*i+0.5))
+    with stage('dwg.save'):
+        dwg.save()
+    if pdf is not None:
+        pdf.endPage( w+cell )
+
+
+# Streaming: the constructs are read, laid out and written one chunk at a
+# time, in the order of their identifiers. The first pass only indexes the
+# library and maps its parts.
+
+def libraryChunks(index, dlib1, chunk=1000):
+    """ Constructs of the LibraryIndex as chunks of (identifier, parts), with the dlib1 of each chunk """
+    for k in range(0, len(index), chunk):
+        yield [index.entry(j) for j in range(k, min(k+chunk, len(index)))], dlib1
+
+
+def designOrder(n, chunk=100000):
+    """ Rows of a design matrix of n rows in the sorted order of their identifiers """
+    names = [np.char.mod('PLASMID%02d', np.arange(k, min(k+chunk, n))+1).astype(bytes)
+             for k in range(0, n, chunk)]
+    if len(names) == 0:
+        return np.zeros(0, dtype=int)
+    return np.argsort(np.concatenate(names), kind='stable')
+
+
+def designChunks(M, chunk=1000):
+    """ Same as libraryChunks for the design matrix, built by fromDesign a chunk at a time """
+    absent = fromDesign(M, [])[1]
+    order = designOrder(M.shape[0])
+    for k in range(0, len(order), chunk):
+        dlib, dlib1 = fromDesign(M, order[k:(k+chunk)], absent)
+        yield list(dlib.items()), dlib1
+
+
+def streamSvg(outfile, chunks, n, cv=False, symbols=False, jobs=1, pdfile=None, cache=None,
+              cell=50, slot=100, css=False):
+    """ Lay out and write the chunks of constructs to the SVG (and the PDF, if
+    any) as they come; n is the number of constructs. Only the width is kept
+    from one chunk to the next. """
+    dwg = SvgStream(outfile)
+    addStylesheet(dwg, css)
+    pdf = None
+    if pdfile is not None:
+        pdf = PdfCanvas(pdfile)
+        pdf.newPage( slot*(2*(n+1)+0.5) )
+    pool = None
+    if jobs > 1 and pdf is None:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=initWorker,
+                                   initargs=(None, symbols, css))
+    fragments = pdf is None and (pool is not None or cache is not None)
+    if symbols and not fragments:
+        glyphs = Symbols(dwg, css)
+    else:
+        glyphs = None
+    seen = set()
+    w = cell
+    first = 0
+    index = None
+    try:
+        for constructs, dlib1 in chunks:
+            constructs = [(first+i+1, libi, construct) for i, (libi, construct) in enumerate(constructs)]
+            first += len(constructs)
+            if index is None or index.dlib1 is not dlib1:
+                # The chunks of a library share its dlib1, and so its tokens
+                index = PartIndex(dlib1, cv)
+            with stage('layout', constructs=len(constructs)) as st:
+                table, labels = layoutLibrary(constructs, dlib1, cv=cv, cell=cell, slot=slot, index=index)
+                st.counts['elements'] = len(table)
+            with stage('writeSvg', constructs=len(constructs), elements=len(table)):
+                if fragments:
+                    w1 = writeFragments(dwg, splitLayout(table), labels, symbols, pool=pool, jobs=jobs,
+                                        cache=cache, seen=seen, cell=cell, send=True, css=css)
+                else:
+                    w1 = renderConstructs(dwg, table, labels, symbols=glyphs, cell=cell, pdf=pdf, css=css)
+            w = max(w, w1)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    dwg.viewbox(width=w+cell, height=slot*(2*(n+1)+0.5))
+    with stage('dwg.save'):
+        dwg.save()
+    if pdf is not None:
+        pdf.endPage( w+cell )
+        with stage('pdf.save', pages=1):
+            pdf.save()
+    return outfile
+
+
+# Summary of a design space: part usage per position, co-occurrence of the
+# levels and promoter/gene pairings, computed over chunks of constructs
+
+def designLevels(M, chunk=100000):
+    """ Positions of the parts built by fromDesign and a generator of chunks of
+    levels (constructs x positions, 0: absent part). Returns also the number
+    of levels, including 0. """
+    M = np.asarray(M)
+    names = ['origin1', 'resistance2']
+    columns = [0, None]
+    absent = [[], []]
+    for j in range(1, M.shape[1], 2):
+        names += ['promoter{}'.format(j+2), 'gene{}'.format(j+3)]
+        columns += [j, j]
+        if j >= 3:
+            # Same absent promoters as fromDesign
+            n = len( np.unique(M[:,j]) )
+            absent += [[int(z)+1 for z in np.arange(n/2, n)], []]
+        else:
+            absent += [[], []]
+    nlevels = int(max(M.max(), 0)) + 2 if M.size > 0 else 2
+    def chunks():
+        for k in range(0, M.shape[0], chunk):
+            block = np.asarray( M[k:(k+chunk)] )
+            levels = np.ones( (len(block), len(names)), dtype=np.int64 )
+            for p, c in enumerate(columns):
+                if c is not None:
+                    levels[:,p] = (block[:,c] + 1).astype(int)
+                    if absent[p]:
+                        levels[np.isin(levels[:,p], absent[p]), p] = 0
+            yield levels
+    return names, chunks(), nlevels
+
+
+def libraryLevels(dlib, dlib1, chunk=100000):
+    """ Same as designLevels for a library: each distinct part token is decoded
+    once into its position and level """
+    decoded = {}
+    positions = {}
+    for parts in dlib.values():
+        for token in parts:
+            if token in decoded:
+                continue
+            x = token.split('_')
+            try:
+                level = int(x[-1])
+                number = int(re.split('([0-9]+)$', x[0])[1])
+            except (ValueError, IndexError):
+                decoded[token] = None
+                continue
+            if dlib1.get(token, 'None') in (None, 'None'):
+                level = 0
+            positions[x[0]] = number
+            decoded[token] = (x[0], level)
+    names = sorted(positions, key=lambda name: (positions[name], name))
+    index = {name: p for p, name in enumerate(names)}
+    codes = {}
+    for token, d in decoded.items():
+        if d is not None:
+            codes[token] = (index[d[0]], d[1])
+    nlevels = max([level for p, level in codes.values()] + [0]) + 1
+    def chunks():
+        libs = sorted(dlib)
+        for k in range(0, len(libs), chunk):
+            levels = np.zeros( (len(libs[k:(k+chunk)]), len(names)), dtype=np.int64 )
+            for i, libi in enumerate(libs[k:(k+chunk)]):
+                for token in dlib[libi]:
+                    if token in codes:
+                        p, level = codes[token]
+                        levels[i, p] = level
+            yield levels
+    return names, chunks(), nlevels
+
+
+def summarize(names, chunks, nlevels):
+    """ Counts over the chunks of levels: usage[position, level] and
+    cooc[p, q, level of p, level of q] for p < q """
+    P, L = len(names), nlevels
+    usage = np.zeros( (P, L), dtype=np.int64 )
+    cooc = np.zeros( (P, P, L, L), dtype=np.int64 )
+    n = 0
+    for levels in chunks:
+        n += len(levels)
+        usage += np.bincount( (np.arange(P)*L + levels).ravel(), minlength=P*L ).reshape(P, L)
+        for p in range(0, P):
+            for q in range(p+1, P):
+                cooc[p, q] += np.bincount( levels[:,p]*L + levels[:,q], minlength=L*L ).reshape(L, L)
+    return SimpleNamespace(names=names, size=n, usage=usage, cooc=cooc)
+
+
+def heatmap(dwg, x, y, counts, total, size, rows, columns, title, color='blue'):
+    """ Grid of cells shaded by their share of total, with row and column
+    headings. Returns the bottom right corner. """
+    w, h = size
+    fs = min(16, h - 4)
+    g = dwg.add( dwg.g(font_family='Verdana', font_size=fs) )
+    g.add( dwg.text(title, insert=(x, y), font_size=24) )
+    y += 16
+    left = x + 0.65*fs*max([len(r) for r in rows] + [1])
+    for j, c in enumerate(columns):
+        g.add( dwg.text(c, insert=(left + (j+0.5)*w, y + fs), text_anchor='middle') )
+    y += fs + 8
+    for i, r in enumerate(rows):
+        g.add( dwg.text(r, insert=(x, y + (i+0.5)*h + 0.35*fs)) )
+        for j in range(0, len(columns)):
+            share = counts[i][j] / float(max(total, 1))
+            g.add( dwg.rect((left + j*w, y + i*h), (w, h), fill=color,
+                            fill_opacity='{:.3f}'.format(share), stroke='#cccccc') )
+            if share > 0 and w >= 3*fs:
+                g.add( dwg.text('{:.0f}%'.format(100*share), insert=(left + (j+0.5)*w, y + (i+0.5)*h + 0.35*fs),
+                                text_anchor='middle', fill='#000000' if share < 0.6 else '#ffffff') )
+    return left + len(columns)*w, y + len(rows)*h
+
+
+def drawSummary(dwg, stats, x, y):
+    """ Panels of part usage, promoter/gene pairings and level co-occurrence.
+    Returns the bottom right corner. """
+    L = stats.usage.shape[1]
+    levels = ['-'] + [str(l) for l in range(1, L)]
+    x1, y1 = heatmap(dwg, x, y, stats.usage, stats.size, (72, 32), stats.names, levels,
+                     'Part usage ({} constructs)'.format(stats.size))
+    right = x1
+    # Each gene with the promoter in front of it
+    y = y1 + 80
+    px = x
+    bottom = y
+    for p, name in enumerate(stats.names[:-1]):
+        if name.startswith('promoter') and stats.names[p+1].startswith('gene'):
+            x2, y2 = heatmap(dwg, px, y, stats.cooc[p, p+1], stats.size, (60, 30),
+                             ['p' + l for l in levels], ['g' + l for l in levels],
+                             '{} / {}'.format(name, stats.names[p+1]), color='green')
+            px = x2 + 40
+            right = max(right, x2)
+            bottom = max(bottom, y2)
+    # Co-occurrence of the levels of the positions that vary
+    varying = [p for p in range(0, len(stats.names)) if np.count_nonzero(stats.usage[p]) > 1]
+    y = bottom + 80
+    if len(varying) > 1:
+        rows = ['{} {}'.format(stats.names[p], l) for p in varying for l in levels]
+        counts = np.zeros( (len(rows), len(rows)), dtype=np.int64 )
+        for a, p in enumerate(varying):
+            for b, q in enumerate(varying):
+                block = np.diag(stats.usage[p]) if p == q else (stats.cooc[p, q] if p < q else stats.cooc[q, p].T)
+                counts[a*L:(a+1)*L, b*L:(b+1)*L] = block
+        x3, y = heatmap(dwg, x, y, counts, stats.size, (18, 18), rows, ['']*len(rows),
+                        'Level co-occurrence', color='magenta')
+        right = max(right, x3)
+    return right, y
+
+
+def sampleRows(n, k, seed=0):
+    """ Sorted random sample of k of the n rows """
+    if k >= n:
+        return np.arange(n)
+    return np.sort( np.random.RandomState(seed).choice(n, k, replace=False) )
+
+
+def writeSummary(outfile, stats, dlib, dlib1, colvariants=False, cell=50, slot=100, css=False):
+    """ Draw the summary panels next to the constructs of the sampled library """
+    libs = sorted(dlib)
+    constructs = [(i+1, libi, dlib[libi]) for i, libi in enumerate(libs)]
+    table, labels = layoutLibrary(constructs, dlib1, cv=colvariants, cell=cell, slot=slot)
+    dwg = svgwrite.Drawing(filename=outfile, debug=False)
+    addStylesheet(dwg, css)
+    w = renderConstructs(dwg, table, labels, cell=cell, css=css)
+    dwg.add( dwg.text('Sample of {} constructs'.format(len(constructs)), insert=(cell, slot),
+                      font_family='Verdana', font_size=24) )
+    x, y = drawSummary(dwg, stats, w + 2*cell, slot)
+    dwg.viewbox(width=x + cell, height=max(y + cell, slot*(2*(len(constructs)+1)+0.5)))
+    dwg.save()
+    return outfile
+
+
+# Differences between two versions of a library: only the constructs that
+# changed are laid out, with their changed parts highlighted
+
+DIFFCOLORS = {'added': 'green', 'removed': 'red', 'modified': 'orange'}
+
+
+def partSequence(construct, dlib1):
+    """ Parts of the construct as (token, part identifier), absent parts as None """
+    seq = []
+    for p in construct:
+        partid = dlib1.get(p)
+        if partid == 'None':
+            partid = None
+        seq.append( (p, partid) )
+    return tuple(seq)
+
+
+def diffLibraries(old, new, match='id'):
+    """ Changes from the old to the new (dlib, dlib1) library as a sorted list of
+    (status, identifier): added, removed or modified. Constructs are matched by
+    identifier, or by part sequence (match='sequence'), in which case moved
+    constructs are not changes and only the unmatched ones with the same
+    identifier are modified. """
+    (dlib0, dlib10), (dlib, dlib1) = old, new
+    if match == 'id':
+        # Tokens identified differently in the two versions; usually none, so
+        # that most constructs are compared by their tokens only
+        remapped = set( p for p in set(dlib10) | set(dlib1)
+                        if dlib10.get(p, 'None') != dlib1.get(p, 'None') )
+        changes = [('removed', libi) for libi in dlib0 if libi not in dlib]
+        for libi in dlib:
+            if libi not in dlib0:
+                changes.append( ('added', libi) )
+            elif dlib0[libi] != dlib[libi] or not remapped.isdisjoint(dlib[libi]):
+                if partSequence(dlib0[libi], dlib10) != partSequence(dlib[libi], dlib1):
+                    changes.append( ('modified', libi) )
+    elif match == 'sequence':
+        # Same identifier and sequence first, then the hashed sequences of the
+        # remaining old constructs are matched once each
+        seqs = {}
+        unmatched = {}
+        for libi in dlib:
+            seq = partSequence(dlib[libi], dlib1)
+            if libi in dlib0 and partSequence(dlib0[libi], dlib10) == seq:
+                continue
+            seqs[libi] = seq
+        for libi in dlib0:
+            if libi in seqs or libi not in dlib:
+                unmatched.setdefault( partSequence(dlib0[libi], dlib10), [] ).append( libi )
+        added = []
+        for libi, seq in seqs.items():
+            if unmatched.get(seq):
+                unmatched[seq].pop(0)
+            else:
+                added.append( libi )
+        removed = set( libi for olds in unmatched.values() for libi in olds )
+        changes = [('removed', libi) for libi in removed if libi not in added]
+        for libi in added:
+            changes.append( ('modified' if libi in removed else 'added', libi) )
+    else:
+        raise ValueError('Unknown match: {}'.format(match))
+    return sorted(changes, key=lambda c: (c[1], c[0]))
+
+
+def diffDesigns(M0, M1, chunk=100000):
+    """ Changes between two design matrices, with constructs matched by row.
+    The rows are compared in chunks and only the changed ones are built.
+    Returns the changes and the old and new (dlib, dlib1) libraries. """
+    n = min(M0.shape[0], M1.shape[0])
+    # Absent promoters depend on the whole design; if they differ, every row is compared
+    if M0.shape[1] != M1.shape[1] or fromDesign(M0, [])[1] != fromDesign(M1, [])[1]:
+        old, new = fromDesign(M0), fromDesign(M1)
+        return diffLibraries(old, new), old, new
+    modified = []
+    for k in range(0, n, chunk):
+        block = slice(k, min(k+chunk, n))
+        modified.append( np.flatnonzero( (np.asarray(M0[block]) != np.asarray(M1[block])).any(axis=1) ) + k )
+    modified = np.concatenate( modified + [np.zeros(0, dtype=int)] )
+    rows0 = np.concatenate( [modified, np.arange(n, M0.shape[0])] )
+    rows1 = np.concatenate( [modified, np.arange(n, M1.shape[0])] )
+    old, new = fromDesign(M0, rows0), fromDesign(M1, rows1)
+    return diffLibraries(old, new), old, new
+
+
+def changedParts(seq0, seq1):
+    """ Indices of the parts that differ in each of the two part sequences """
+    changed0, changed1 = set(), set()
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, seq0, seq1, autojunk=False).get_opcodes():
+        if op != 'equal':
+            changed0.update( range(i1, i2) )
+            changed1.update( range(j1, j2) )
+    return changed0, changed1
+
+
+def layoutDiff(changes, old, new, cv=False, cell=50, slot=100):
+    """ Layout table of the changes, a modified construct taking two slots
+    (old and new version), and the highlights as (row, status, part rows) """
+    labels = Labels()
+    rows = []
+    highlights = []
+    pos = 0
+    indices = {'-': PartIndex(old[1], cv), '+': PartIndex(new[1], cv)}
+    for status, libi in changes:
+        versions = []
+        if status in ('removed', 'modified'):
+            versions.append( ('-', old) )
+        if status in ('added', 'modified'):
+            versions.append( ('+', new) )
+        if status == 'modified':
+            changed = changedParts( partSequence(old[0][libi], old[1]), partSequence(new[0][libi], new[1]) )
+        else:
+            changed = [set()]
+        for (sign, (dlib, dlib1)), parts in zip(versions, changed):
+            pos += 1
+            drawn = {}
+            construct = addNewConstruct('{} {}'.format(sign, dlib1.get(libi, libi)), dlib[libi],
+                                        base=(2*pos+0.5)*slot, cell=cell, slot=slot, dlibid=dlib1,
+                                        cv=cv, labels=labels, pos=pos, drawn=drawn, index=indices[sign])
+            marked = [len(rows) + drawn[i] for i in sorted(drawn) if i in parts]
+            highlights.append( (len(rows), status, marked) )
+            rows.extend( construct )
+    return np.array(rows, dtype=LAYOUT), labels, highlights
+
+
+def writeDiff(outfile, changes, old, new, colvariants=False, cell=50, slot=100, css=False):
+    """ Draw the changes between the two libraries: a band on the left in the
+    colour of the change and the changed parts highlighted """
+    table, labels, highlights = layoutDiff(changes, old, new, cv=colvariants, cell=cell, slot=slot)
+    dwg = svgwrite.Drawing(filename=outfile, debug=True)
+    addStylesheet(dwg, css)
+    counts = [sum(1 for c in changes if c[0] == status) for status in DIFFCOLORS]
+    dwg.add( dwg.text('{} added, {} removed, {} modified'.format(*counts), insert=(cell, slot),
+                      font_family='Verdana', font_size=24) )
+    g = dwg.add( dwg.g(fill_opacity=0.25) )
+    for first, status, marked in highlights:
+        y = table['y'][first]
+        g.add( dwg.rect((0.2*cell, y - 0.5*slot), (0.4*cell, 1.5*slot), fill=DIFFCOLORS[status], fill_opacity=0.8) )
+        for k in marked:
+            t, x, y = table['type'][k], table['x'][k], table['y'][k]
+            x1, x2 = EXTENT.get(t, (0, cell))
+            g.add( dwg.rect((coord(x + x1 - 10), y - 0.45*slot), (x2 - x1 + 20, 0.9*slot), fill='yellow',
+                            stroke=DIFFCOLORS[status]) )
+    w = renderConstructs(dwg, table, labels, cell=cell, css=css)
+    n = len(highlights)
+    dwg.viewbox(width=w + cell, height=slot*(2*(n+1)+0.5))
+    dwg.save()
+    return outfile
+
+
+# Raster thumbnails: the layout table is drawn directly at low resolution,
+# without text (titles are shown as grey bars)
+
+RGB = {'red': (255, 0, 0), 'blue': (0, 0, 255), 'green': (0, 128, 0),
+       'chartreuse': (127, 255, 0), 'magenta': (255, 0, 255), 'grey': (128, 128, 128),
+       'cyan': (0, 255, 255), 'darksalmon': (233, 150, 122), 'lavender': (230, 230, 250),
+       'orange': (255, 165, 0)}
+
+
+def rgb(color):
+    """ RGB of a COLORS name or of a #rrggbb colour """
+    if color.startswith('#'):
+        return tuple(int(color[i:(i+2)], 16) for i in (1, 3, 5))
+    return RGB[color]
+
+
+def segmentDistance(px, py, x1, y1, x2, y2):
+    """ Distance of the points to the segment """
+    dx, dy = x2 - x1, y2 - y1
+    d = dx*dx + dy*dy
+    if d == 0:
+        t = 0
+    else:
+        t = np.clip( ((px - x1)*dx + (py - y1)*dy) / d, 0, 1 )
+    return np.hypot(px - x1 - t*dx, py - y1 - t*dy)
+
+
+def insidePolygon(px, py, points):
+    """ Even-odd rule for the points in the (implicitly closed) polygon """
+    inside = np.zeros(px.shape, dtype=bool)
+    for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+        if y1 == y2:
+            continue
+        cross = (py >= min(y1, y2)) & (py < max(y1, y2))
+        xc = x1 + (py - y1)*(x2 - x1)/(y2 - y1)
+        inside ^= cross & (px < xc)
+    return inside
+
+
+class Raster:
+    """ Image of a layout table, sx and sy pixels per unit. Each glyph style is
+    rasterised once (supersampled) and added at every occurrence. Colours
+    falling on the same pixel are averaged by coverage. """
+    def __init__(self, width, height, sx, sy, ss=4):
+        self.width = width
+        self.height = height
+        self.sx = sx
+        self.sy = sy
+        self.ss = ss
+        self.drawn = []
+        self.sprites = {}
+
+    def sprite(self, part):
+        """ Offset (units) and premultiplied coverage of the glyph of the part """
+        name, shapes, gx, gy = part.shapes
+        key = (name,) + tuple(sorted(part.kwargs.items()))
+        if key in self.sprites:
+            return self.sprites[key]
+        sw = float(part.kwargs['stroke_width'])
+        pts = []
+        for kind, geometry, extra in shapes:
+            if kind == 'circle':
+                cx, cy, r = geometry
+                pts += [(cx - r, cy - r), (cx + r, cy + r)]
+            else:
+                pts += [op[1:] for op in geometry if len(op) > 1]
+        pts = np.array(pts, dtype=float)
+        x0, y0 = pts.min(axis=0) - sw/2
+        x1, y1 = pts.max(axis=0) + sw/2
+        w = int(math.ceil( (x1 - x0)*self.sx )) + 1
+        h = int(math.ceil( (y1 - y0)*self.sy )) + 1
+        ss = self.ss
+        px = x0 + (np.arange(w*ss) + 0.5) / (ss*self.sx)
+        py = y0 + (np.arange(h*ss) + 0.5) / (ss*self.sy)
+        px, py = np.meshgrid(px, py)
+        color = np.zeros(px.shape + (3,))
+        cover = np.zeros(px.shape, dtype=bool)
+        stroke = rgb(part.kwargs['stroke'])
+        for kind, geometry, extra in shapes:
+            fill = extra.get('fill', part.kwargs.get('fill', '#000000'))
+            if kind == 'circle':
+                cx, cy, r = geometry
+                d = np.hypot(px - cx, py - cy)
+                filled = d <= r
+                stroked = np.abs(d - r) <= sw/2
+            else:
+                points = []
+                stroked = np.zeros(px.shape, dtype=bool)
+                for op in geometry:
+                    if op[0] == 'M':
+                        points = [op[1:]]
+                    elif op[0] == 'L':
+                        stroked |= segmentDistance(px, py, *(points[-1] + op[1:])) <= sw/2
+                        points.append( op[1:] )
+                filled = insidePolygon(px, py, points)
+            if fill != 'none':
+                color[filled] = rgb(fill)
+                cover |= filled
+            color[stroked] = stroke
+            cover |= stroked
+        # Average of the supersamples of each pixel
+        alpha = cover.reshape(h, ss, w, ss).mean(axis=(1, 3))
+        color = (color*cover[..., None]).reshape(h, ss, w, ss, 3).mean(axis=(1, 3))
+        self.sprites[key] = (gx + x0, gy + y0, alpha, color)
+        return self.sprites[key]
+
+    def add(self, idx, weight, color):
+        """ Coverage and premultiplied colour at the flat pixel indices (-1: outside) """
+        keep = idx >= 0
+        self.drawn.append( (idx[keep], weight[keep], color[keep]) )
+
+    def stamp(self, sprite, x, y):
+        """ Add the sprite at each (x, y) of the parts """
+        ox, oy, alpha, color = sprite
+        h, w = alpha.shape
+        col = np.floor( (x + ox)*self.sx ).astype(int)[:, None, None] + np.arange(w)[None, None, :]
+        row = np.floor( (y + oy)*self.sy ).astype(int)[:, None, None] + np.arange(h)[None, :, None]
+        valid = (col >= 0) & (col < self.width) & (row >= 0) & (row < self.height)
+        idx = np.where(valid, row*self.width + col, -1)
+        n = len(x)
+        self.add( idx.ravel(), np.broadcast_to(alpha, (n, h, w)).ravel(),
+                  np.broadcast_to(color, (n, h, w, 3)).reshape(-1, 3) )
+
+    def bars(self, x1, x2, y, thickness, color, opacity=1.0):
+        """ Add horizontal bars from x1 to x2 centred at y """
+        if len(x1) == 0:
+            return
+        t = thickness*self.sy
+        top = y*self.sy - t/2
+        k = int(math.ceil(t)) + 1
+        rows = np.floor(top).astype(int)[:, None] + np.arange(k)[None, :]
+        cover = np.clip( np.minimum(rows + 1, top[:, None] + t) - np.maximum(rows, top[:, None]), 0, 1 )
+        c1 = np.floor(x1*self.sx).astype(int)
+        c2 = np.maximum(c1 + 1, np.ceil(x2*self.sx).astype(int))
+        length = np.clip(c2, 0, self.width) - np.clip(c1, 0, self.width)
+        c1 = np.clip(c1, 0, self.width)
+        # Columns of each bar, then the k rows of each column
+        bar = np.repeat( np.arange(len(x1)), length )
+        col = np.arange(length.sum()) - np.repeat( np.cumsum(length) - length, length ) + c1[bar]
+        row = rows[bar]
+        valid = (row >= 0) & (row < self.height)
+        idx = np.where(valid, row*self.width + col[:, None], -1).ravel()
+        weight = (cover[bar]*opacity).ravel()
+        self.add( idx, weight, weight[:, None]*np.array(color, dtype=float)[None, :] )
+
+    def image(self):
+        """ RGB image on a white background """
+        n = self.width*self.height
+        img = np.full((n, 3), 255.0)
+        if self.drawn:
+            idx, weight, color = [np.concatenate(x) for x in zip(*self.drawn)]
+            cov = np.bincount(idx, weights=weight, minlength=n)
+            a = np.minimum(cov, 1)
+            for c in range(0, 3):
+                acc = np.bincount(idx, weights=color[:, c], minlength=n)
+                img[:, c] = 255*(1 - a) + acc / np.maximum(cov, 1e-12) * a
+        return np.clip(np.rint(img), 0, 255).astype(np.uint8).reshape(self.height, self.width, 3)
+
+
+# Horizontal extent of the glyph of each part type from its x
+EXTENT = {PPROMOTER: (10, 40), PCDS: (9, 42), PORIGIN: (0, 24), PTERMINATOR: (10, 40)}
+
+
+def rasterLayout(table, labels, width=256, height=None, cell=50, slot=100):
+    """ Thumbnail of the layout table, width pixels wide. If the drawing would
+    be taller than height, the constructs are squeezed vertically; when the
+    glyphs would be too small, each construct is drawn as a band of coloured
+    parts instead. """
+    n = int(table['construct'].max()) if len(table) > 0 else 0
+    wu = layoutWidth(table, cell) + cell
+    hu = slot*(2*(n+1)+0.5)
+    sx = float(width) / wu
+    sy = sx
+    if height is not None:
+        sy = min(sx, float(height) / hu)
+    raster = Raster(width, int(math.ceil(hu*sy)), sx, sy)
+    lines = table[table['type'] == PLINE]
+    parts = table[(table['type'] != PLINE) & (table['type'] != PTITLE)]
+    if 30*sy < 6:
+        # Overview: bands of 2*slot centred on the parts
+        raster.bars(lines['x'], lines['x2'], lines['y'], 0.4*slot, (0, 0, 0), 0.3)
+        for t, (x1, x2) in EXTENT.items():
+            for k in range(-1, len(COLORS)):
+                sel = parts[(parts['type'] == t) & (parts['color'] == k)]
+                color = (0, 0, 0) if k < 0 else rgb(COLORS[k])
+                raster.bars(sel['x'] + x1, sel['x'] + x2, sel['y'], 1.6*slot, color)
+        return raster.image()
+    raster.bars(lines['x'], lines['x2'], lines['y'], 3, (0, 0, 0))
+    titles = table[table['type'] == PTITLE]
+    size = np.array([len(labels[i]) for i in titles['label']], dtype=float)
+    # Greeked 24px text above the baseline
+    raster.bars(titles['x'], titles['x'] + 0.6*24*size, titles['y'] - 9, 12, (0, 0, 0), 0.5)
+    # Greeked 16px part labels below the parts, in the colour of the part
+    named = parts[parts['label'] >= 0]
+    size = np.array([len(labels[i]) for i in named['label']], dtype=float)
+    x = named['x'] + np.select([named['type'] == PCDS, named['type'] == PORIGIN], [9, -50], 0)
+    # Origin labels are black
+    ink = np.where(named['type'] == PORIGIN, -1, named['color'])
+    for k in np.unique( ink ):
+        sel = ink == k
+        color = (0, 0, 0) if k < 0 else rgb(COLORS[k])
+        raster.bars(x[sel], x[sel] + 0.6*16*size[sel], named['y'][sel] + 35, 8, color, 0.4)
+    styles, first, inverse = np.unique( parts[['type', 'color']], return_index=True, return_inverse=True )
+    glyphs = Labels()
+    glyphs.add( 'glyph' )
+    for k in range(0, len(styles)):
+        row = parts[first[k]].copy()
+        row['x'], row['y'], row['label'] = 0, 0, 0
+        part = layoutParts(np.array([row]), glyphs)[0]
+        sel = parts[inverse.ravel() == k]
+        raster.stamp( raster.sprite(part), sel['x'], sel['y'] )
+    return raster.image()
+
+
+def writePng(filename, img):
+    """ Write the RGB image as a PNG file """
+    import zlib
+    import struct
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    h, w = img.shape[:2]
+    # Filter type 0 (None) on every scanline
+    raw = np.concatenate( [np.zeros((h, 1), dtype=np.uint8), img.reshape(h, w*3)], axis=1 )
+    with open(filename, 'wb') as handler:
+        handler.write( b'\x89PNG\r\n\x1a\n' )
+        handler.write( chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0)) )
+        handler.write( chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) )
+        handler.write( chunk(b'IEND', b'') )
+
+
+def thumbnail(table, labels, outfile, width=256, height=None, first=None, cell=50, slot=100):
+    """ Write a PNG preview of the first constructs (all by default) """
+    if first is not None:
+        table = table[table['construct'] <= first]
+    writePng( outfile, rasterLayout(table, labels, width, height, cell, slot) )
+    return outfile
+
+
+# Interactive HTML viewer: the layout is exported as compact JSON chunks that
+# the page parses and draws only when the constructs scroll into view
+
+VIEWER = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ margin: 0; font-family: Verdana, sans-serif; }}
+#bar {{ position: fixed; top: 0; left: 0; right: 0; height: 36px; padding: 4px 8px; box-sizing: border-box;
+        background: #f4f4f4; border-bottom: 1px solid #ccc; z-index: 1; }}
+#view {{ position: absolute; top: 36px; left: 0; right: 0; bottom: 0; overflow: auto; }}
+#canvas {{ position: sticky; top: 0; left: 0; display: block; }}
+</style>
+</head>
+<body>
+<div id="bar">
+<input id="query" size="30" placeholder="Plasmid or part ID">
+<button id="prev">&lt;</button><button id="next">&gt;</button>
+<span id="found"></span>
+<button id="zoomout">-</button><button id="zoomin">+</button>
+<span id="info"></span>
+</div>
+<div id="view"><canvas id="canvas"></canvas><div id="spacer"></div></div>
+<script type="application/json" id="layout">{layout}</script>
+{chunks}
+<script>
+(function() {{
+var L = JSON.parse(document.getElementById('layout').textContent);
+var PLINE = 5, PTITLE = 0;
+var view = document.getElementById('view'), canvas = document.getElementById('canvas');
+var spacer = document.getElementById('spacer'), ctx = canvas.getContext('2d');
+var chunks = [], zoom = 1, hits = [], hit = -1;
+var fit = Math.min(1, (view.clientWidth - 20) / L.width);
+
+function chunk(k) {{
+  // Chunks are parsed the first time one of their constructs is needed
+  if (!chunks[k]) chunks[k] = JSON.parse(document.getElementById('chunk' + k).textContent);
+  return chunks[k];
+}}
+function construct(i) {{ return chunk(Math.floor(i / L.chunk))[i % L.chunk]; }}
+function scale() {{ return fit * zoom; }}
+function rowHeight() {{ return 2 * L.slot * scale(); }}
+
+function resize() {{
+  spacer.style.height = (L.height * scale()) + 'px';
+  spacer.style.width = (L.width * scale()) + 'px';
+  spacer.style.marginTop = -view.clientHeight + 'px';
+  var r = window.devicePixelRatio || 1;
+  canvas.width = view.clientWidth * r;
+  canvas.height = view.clientHeight * r;
+  canvas.style.width = view.clientWidth + 'px';
+  canvas.style.height = view.clientHeight + 'px';
+  draw();
+}}
+
+function glyph(t, x, y, c) {{
+  var g = L.glyphs[t], color = c >= 0 ? L.colors[c] : null;
+  ctx.save();
+  ctx.translate(x + g.x, y + g.y);
+  ctx.strokeStyle = (g.paint == 'stroke' && color) || '#000000';
+  for (var s = 0; s < g.shapes.length; s++) {{
+    var kind = g.shapes[s][0], geo = g.shapes[s][1], fill = g.shapes[s][2];
+    ctx.beginPath();
+    if (kind == 'circle') {{
+      ctx.arc(geo[0], geo[1], geo[2], 0, 2 * Math.PI);
+    }} else {{
+      for (var k = 0; k < geo.length; k++) {{
+        if (geo[k][0] == 'M') ctx.moveTo(geo[k][1], geo[k][2]);
+        else if (geo[k][0] == 'L') ctx.lineTo(geo[k][1], geo[k][2]);
+        else ctx.closePath();
+      }}
+    }}
+    if (fill != 'none') {{
+      ctx.fillStyle = (g.paint == 'fill' && color) || '#000000';
+      ctx.fill();
+    }}
+    ctx.stroke();
+  }}
+  ctx.restore();
+}}
+
+function label(t, l, x, y, c) {{
+  var g = L.glyphs[t];
+  if (!g.label || l < 0) return;
+  ctx.fillStyle = g.label[3] == 'color' ? (c >= 0 ? L.colors[c] : '#000000') : g.label[3];
+  ctx.font = g.label[2] + 'px Verdana';
+  ctx.fillText(L.labels[l], x + g.label[0], y + g.label[1]);
+}}
+
+function draw() {{
+  var r = window.devicePixelRatio || 1, s = scale();
+  ctx.setTransform(r, 0, 0, r, 0, 0);
+  ctx.clearRect(0, 0, view.clientWidth, view.clientHeight);
+  ctx.setTransform(r * s, 0, 0, r * s, -view.scrollLeft * r, -view.scrollTop * r);
+  ctx.lineWidth = 3;
+  ctx.lineCap = 'round';
+  ctx.lineJoin = 'round';
+  var first = Math.max(0, Math.floor(view.scrollTop / rowHeight()) - 1);
+  var last = Math.min(L.size, Math.ceil((view.scrollTop + view.clientHeight) / rowHeight()) + 1);
+  for (var i = first; i < last; i++) {{
+    var entry = construct(i), design = L.designs[entry[1]];
+    var base = (2 * (i + 1) + 0.5) * L.slot, y = base + L.slot;
+    if (hits[hit] == i) {{
+      ctx.fillStyle = '#ffff99';
+      ctx.fillRect(0, base, L.width, 2 * L.slot);
+    }}
+    ctx.fillStyle = '#000000';
+    ctx.font = '24px Verdana';
+    ctx.fillText(L.labels[entry[0]], L.cell, base + 0.5 * L.slot);
+    for (var k = 0; k < design.length; ) {{
+      var t = design[k];
+      if (t == PLINE) {{
+        ctx.strokeStyle = '#000000';
+        ctx.beginPath();
+        ctx.moveTo(design[k + 1], y);
+        ctx.lineTo(design[k + 2], y);
+        ctx.stroke();
+        k += 3;
+      }} else {{
+        glyph(t, design[k + 1], y, design[k + 2]);
+        label(t, design[k + 3], design[k + 1], y, design[k + 2]);
+        k += 4;
+      }}
+    }}
+  }}
+  document.getElementById('info').textContent = L.size + ' constructs, showing ' +
+    Math.min(first + 1, L.size) + '-' + last;
+}}
+
+function search() {{
+  var q = document.getElementById('query').value.trim().toLowerCase();
+  hits = []; hit = -1;
+  if (q.length > 0) {{
+    var match = {{}}, designs = {{}};
+    for (var l = 0; l < L.labels.length; l++) {{
+      if (L.labels[l].toLowerCase().indexOf(q) >= 0) match[l] = true;
+    }}
+    for (var d = 0; d < L.designs.length; d++) {{
+      var design = L.designs[d];
+      for (var k = 0; k < design.length; ) {{
+        if (design[k] == PLINE) {{ k += 3; continue; }}
+        if (match[design[k + 3]]) designs[d] = true;
+        k += 4;
+      }}
+    }}
+    for (var i = 0; i < L.size; i++) {{
+      var entry = construct(i);
+      if (match[entry[0]] || designs[entry[1]]) hits.push(i);
+    }}
+  }}
+  hit = 0;
+  go(0);
+}}
+
+function go(step) {{
+  if (hits.length == 0) {{
+    document.getElementById('found').textContent = 'no match';
+    draw();
+    return;
+  }}
+  hit = ((hit + step) % hits.length + hits.length) % hits.length;
+  document.getElementById('found').textContent = (hit + 1) + '/' + hits.length;
+  view.scrollTop = (2 * (hits[hit] + 1) + 0.5) * L.slot * scale() - 20;
+  draw();
+}}
+
+function rezoom(f) {{
+  var top = view.scrollTop / scale();
+  zoom *= f;
+  resize();
+  view.scrollTop = top * scale();
+}}
+
+view.addEventListener('scroll', draw);
+window.addEventListener('resize', resize);
+var searched = null;
+document.getElementById('query').addEventListener('keydown', function(e) {{
+  if (e.key != 'Enter') return;
+  // Enter again on the same query moves to the next match
+  if (e.target.value == searched) {{
+    go(1);
+  }} else {{
+    searched = e.target.value;
+    search();
+  }}
+}});
+document.getElementById('next').onclick = function() {{ go(1); }};
+document.getElementById('prev').onclick = function() {{ go(-1); }};
+document.getElementById('zoomin').onclick = function() {{ rezoom(1.25); }};
+document.getElementById('zoomout').onclick = function() {{ rezoom(0.8); }};
+resize();
+}})();
+</script>
+</body>
+</html>
+'''
+
+
+def htmlGlyphs():
+    """ Glyph of each part type as drawn by the Part classes: shapes, offset,
+    attribute taking the colour and label (x, y, size, ink) """
+    glyphs = {}
+    names = Labels()
+    names.add( 'glyph' )
+    for t in (PPROMOTER, PCDS, PORIGIN, PTERMINATOR):
+        part = layoutParts(np.array([(1, t, 0, 0, 0, 0, 0, 0)], dtype=LAYOUT), names)[0]
+        name, shapes, gx, gy = part.shapes
+        glyph = {'x': gx, 'y': gy,
+                 'paint': 'fill' if part.kwargs.get('fill') == COLORS[0] else 'stroke',
+                 'shapes': [(kind, geometry, extra.get('fill')) for kind, geometry, extra in shapes],
+                 'label': None}
+        if part.labels:
+            text, x, y, fill, size = part.labels[0]
+            glyph['label'] = (x, y, int(size), 'color' if fill == COLORS[0] else fill)
+        glyphs[t] = glyph
+    return glyphs
+
+
+def htmlLayout(table, labels, cell=50, slot=100):
+    """ Compact layout: each construct is its title and the index of its design,
+    the parts shared by identical constructs. A design is a flat list of
+    parts, (type, x, color, label), and lines, (PLINE, x, x2). """
+    designs = {}
+    flat = []
+    constructs = []
+    for rows in splitLayout(table) if len(table) > 0 else []:
+        title = rows[rows['type'] == PTITLE]
+        parts = rows[rows['type'] != PTITLE][['type', 'x', 'x2', 'color', 'label']].tolist()
+        key = tuple(parts)
+        if key not in designs:
+            design = []
+            for t, x, x2, c, l in parts:
+                if t == PLINE:
+                    design += [t, coord(x), coord(x2)]
+                else:
+                    design += [t, coord(x), c, l]
+            designs[key] = len(flat)
+            flat.append( design )
+        constructs.append( (int(title['label'][0]), designs[key]) )
+    n = len(constructs)
+    layout = {'size': n, 'cell': cell, 'slot': slot,
+              'width': layoutWidth(table, cell) + cell, 'height': slot*(2*(n+1)+0.5),
+              'colors': COLORS, 'labels': labels.text, 'designs': flat,
+              'glyphs': htmlGlyphs()}
+    return layout, constructs
+
+
+def jsonScript(data):
+    """ JSON that can be embedded in a script element: no '<' is left to end
+    the element or open a comment in it """
+    return json.dumps(data, separators=(',', ':')).replace('<', '\\u003c')
+
+
+def writeHtml(outfile, table, labels, cell=50, slot=100, chunk=1000, title='viscad'):
+    """ Write the self-contained viewer of the layout table; the constructs
+    are embedded in chunks parsed on demand """
+    layout, constructs = htmlLayout(table, labels, cell, slot)
+    layout['chunk'] = chunk
+    with open(outfile, 'w') as handler:
+        chunks = []
+        for k in range(0, len(constructs), chunk):
+            chunks.append( '<script type="application/json" id="chunk{}">{}</script>'.format(
+                k // chunk, jsonScript(constructs[k:(k+chunk)])) )
+        handler.write( VIEWER.format(title=html.escape(title), layout=jsonScript(layout),
+                                     chunks='\n'.join(chunks)) )
+    return outfile
+
+
+# Instrumentation: stages of the run are reported to the registered hooks,
+# hook(name, None) when a stage starts and hook(name, info) when it ends, with
+# info = {'wall': s, 'cpu': s, 'peak': bytes or None, **counts}. Stages can be
+# nested; the figures of a stage include those of the stages inside it.
+hooks = []
+running = []
+
+class stage:
+    """ Context of a stage of the run: with stage('layout', constructs=n) as st: ...
+    Counts known only at the end are added to st.counts. Nothing is measured
+    when no hook is registered. """
+    __slots__ = ('name', 'counts', 't0', 'c0', 'peak')
+
+    def __init__(self, name, **counts):
+        self.name = name
+        self.counts = counts
+
+    def __enter__(self):
+        if hooks:
+            for hook in hooks:
+                hook(self.name, None)
+            self.peak = None
+            if tracemalloc.is_tracing():
+                # The peak is reset for this stage, keep the one of the enclosing stage
+                if running:
+                    running[-1].peak = max(running[-1].peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+                self.peak = 0
+            running.append( self )
+            self.c0 = time.process_time()
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if hooks:
+            wall = time.perf_counter() - self.t0
+            cpu = time.process_time() - self.c0
+            running.remove( self )
+            if self.peak is not None:
+                self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+                if running:
+                    running[-1].peak = max(running[-1].peak, self.peak)
+            info = {'wall': wall, 'cpu': cpu, 'peak': self.peak}
+            info.update( self.counts )
+            for hook in hooks:
+                hook(self.name, info)
+
+
+class Profiler:
+    """ Hook summarising the stages: calls, wall and CPU time, peak memory (traced
+    with tracemalloc if memory), counts and constructs per second. If cprofile
+    names a stage, that stage is also run under cProfile. """
+    def __init__(self, memory=True, cprofile=None):
+        self.memory = memory
+        self.cprofile = cprofile
+        self.profile = None
+        self.stages = OrderedDict()
+
+    def __call__(self, name, info):
+        if name == self.cprofile:
+            if self.profile is None:
+                import cProfile
+                self.profile = cProfile.Profile()
+            if info is None:
+                self.profile.enable()
+            else:
+                self.profile.disable()
+        if info is None:
+            return
+        st = self.stages.setdefault( name, {'calls': 0} )
+        st['calls'] += 1
+        for k, v in info.items():
+            if k == 'peak':
+                st[k] = v if st.get(k) is None else max(st[k], v or 0)
+            else:
+                st[k] = st.get(k, 0) + v
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        else:
+            self.memory = False
+        self.c0 = time.process_time()
+        self.t0 = time.perf_counter()
+        hooks.append( self )
+        return self
+
+    def __exit__(self, *exc):
+        hooks.remove( self )
+        self.wall = time.perf_counter() - self.t0
+        self.cpu = time.process_time() - self.c0
+        if self.memory:
+            tracemalloc.stop()
+
+    def summary(self):
+        stages = []
+        for name, st in self.stages.items():
+            st = dict(stage=name, **st)
+            if 'constructs' in st and st['wall'] > 0:
+                st['constructs/s'] = st['constructs'] / st['wall']
+            stages.append( st )
+        return {'wall': self.wall, 'cpu': self.cpu, 'stages': stages}
+
+    def save(self, outfile):
+        """ Write the summary as JSON, and the cProfile stats next to it (.prof) """
+        with open(outfile, 'w') as h:
+            json.dump(self.summary(), h, indent=1)
+        if self.profile is not None:
+            self.profile.dump_stats( os.path.splitext(outfile)[0]+'.prof' )
+
+
+def readConstructs(f1=None, M=None, libcache=None, f2=None, v2=False):
+    """ Library (dlib, dlib1) of the .j0/.ji0 files of f1, or of the DoE
+    spreadsheet f1 with the ICE sheet f2 (see sheetLibrary for v2), taken from
+    the LibraryCache libcache if any, or of the design matrix M (or its file) """
+    if M is None and f1.endswith(SHEETS):
+        sources = [f1] if f2 is None else [f1, f2]
+        if v2:
+            # The cache entries are those of the default layout of the ICE sheet
+            libcache = None
+        cached = None
+        if libcache is not None:
+            with stage('loadLibrary'):
+                cached = libcache.load(sources)
+        if cached is not None:
+            return cached
+        with stage('readSheets') as st:
+            dlib, dlib1 = sheetLibrary(f1, f2, v2)
+            st.counts.update(constructs=len(dlib), parts=len(dlib1))
+        if libcache is not None:
+            with stage('saveLibrary'):
+                libcache.save(sources, dlib, dlib1)
+        return dlib, dlib1
     if M is None:
         f1j0 = re.sub('.txt', '.j0', f1)
         f1ji0 = re.sub('.j0', '.ji0', f1j0)
-        dlib = readLibrary(f1j0)
-        dlib1 = mapLibrary(dlib, f1ji0)
-    else:
+        cached = None
+        if libcache is not None:
+            with stage('loadLibrary'):
+                cached = libcache.load([f1j0, f1ji0])
+        if cached is not None:
+            return cached
+        with stage('readLibrary') as st:
+            dlib = readLibrary(f1j0)
+            st.counts['constructs'] = len(dlib)
+        with stage('mapLibrary', constructs=len(dlib)) as st:
+            dlib1 = mapLibrary(dlib, f1ji0)
+            st.counts['parts'] = len(dlib1)
+        if libcache is not None:
+            with stage('saveLibrary'):
+                libcache.save([f1j0, f1ji0], dlib, dlib1)
+        return dlib, dlib1
+    if isinstance(M, str):
+        with stage('loadDesign'):
+            M = loadDesign(M)
+    with stage('fromDesign', constructs=M.shape[0]) as st:
         dlib, dlib1 = fromDesign(M)
-    ncmap = mapnewParts(dlib, dlib1)
-    dwg = svgwrite.Drawing(filename=outfile, debug=True)
+        st.counts['parts'] = len(dlib1)
+    return dlib, dlib1
+
+
+def createnewCad(f1=None, f2=None, outfile=None, v2=True, M=None, colvariants=False, symbols=False,
+                 stream=False, jobs=1, perpage=None, pdfile=None, cache=None, dedup=False,
+                 unique=False, png=None, pngsize=(256, 256), pngfirst=None, html=None,
+                 libcache=None, summary=None, diff=None, match='id', css=False):
+    """ Render the library. With perpage, each page of constructs is written
+    to its own file (name_p001.svg, ...). If pdfile is given, the PDF is drawn
+    directly alongside the SVG (one page per SVG). Constructs found in the
+    RenderCache, if any, are not rendered again. With dedup, constructs with
+    the same parts share a single drawing; with unique, only the distinct
+    designs are drawn, with their counts. If png is given, a thumbnail of the
+    first pngfirst constructs (default: all) is written, pngsize = (width,
+    maximum height). If html is given, the interactive viewer is written too.
+    Parsed libraries are taken from the LibraryCache libcache, if any. M can
+    also be the file of the design matrix. With summary, only a summary of
+    the library (heatmaps of the part statistics next to a sample of summary
+    constructs) is drawn. With diff, the (dlib, dlib1) of a previous version
+    of the library or its design matrix, only the constructs added, removed
+    or modified since then are drawn, matched by identifier or by part
+    sequence (match). With stream, the library is streamed from the input
+    files to the output in chunks, unless an option needs all the layout at
+    once. With css, the style of the parts is set by the classes of a style
+    sheet instead of attributes. Returns the list of SVG files. """
+    if f2 is not None and not f2.endswith(SHEETS):
+        # The ICE numbers of the .j0 libraries are in their .ji0 file
+        f2 = None
+    if stream and summary is None and diff is None and perpage is None and png is None and html is None \
+       and not (dedup or unique):
+        if M is None and f1.endswith(SHEETS):
+            # The sheets are read at once, only the layout and output are streamed
+            dlib, dlib1 = readConstructs(f1, libcache=libcache, f2=f2, v2=v2)
+            libs = sorted(dlib)
+            n, chunks = len(libs), (([(k, dlib[k]) for k in libs[j:(j+1000)]], dlib1)
+                                    for j in range(0, len(libs), 1000))
+        elif M is None:
+            f1j0 = re.sub('.txt', '.j0', f1)
+            with stage('indexLibrary') as st:
+                index = LibraryIndex(f1j0)
+                st.counts['constructs'] = len(index)
+            with stage('mapLibrary', constructs=len(index)) as st:
+                dlib1 = mapLibrary(index, re.sub('.j0', '.ji0', f1j0))
+                st.counts['parts'] = len(dlib1)
+            n, chunks = len(index), libraryChunks(index, dlib1)
+        else:
+            if isinstance(M, str):
+                with stage('loadDesign'):
+                    M = loadDesign(M)
+            n, chunks = M.shape[0], designChunks(M)
+        try:
+            streamSvg(outfile, chunks, n, cv=colvariants, symbols=symbols, jobs=jobs, pdfile=pdfile,
+                      cache=cache, css=css)
+        finally:
+            if M is None and not f1.endswith(SHEETS):
+                index.close()
+        return [outfile]
+    if summary is not None and M is not None:
+        if isinstance(M, str):
+            with stage('loadDesign'):
+                M = loadDesign(M)
+        with stage('summary', constructs=M.shape[0]):
+            stats = summarize(*designLevels(M))
+            dlib, dlib1 = fromDesign(M, sampleRows(M.shape[0], summary))
+            writeSummary(outfile, stats, dlib, dlib1, colvariants, css=css)
+        return [outfile]
+    if diff is not None and not isinstance(diff, tuple):
+        if isinstance(diff, str):
+            with stage('loadDesign'):
+                diff = loadDesign(diff)
+        if M is not None and match == 'id':
+            if isinstance(M, str):
+                with stage('loadDesign'):
+                    M = loadDesign(M)
+            with stage('diff', constructs=M.shape[0]) as st:
+                changes, old, new = diffDesigns(diff, M)
+                st.counts['changes'] = len(changes)
+                writeDiff(outfile, changes, old, new, colvariants, css=css)
+            return [outfile]
+        diff = readConstructs(M=diff)
+    dlib, dlib1 = readConstructs(f1, M, libcache, f2, v2)
+    if summary is not None:
+        with stage('summary', constructs=len(dlib)):
+            stats = summarize(*libraryLevels(dlib, dlib1))
+            libs = sorted(dlib)
+            sample = OrderedDict( (libs[i], dlib[libs[i]]) for i in sampleRows(len(libs), summary) )
+            writeSummary(outfile, stats, sample, dlib1, colvariants, css=css)
+        return [outfile]
+    if diff is not None:
+        with stage('diff', constructs=len(dlib)) as st:
+            changes = diffLibraries(diff, (dlib, dlib1), match=match)
+            st.counts['changes'] = len(changes)
+            writeDiff(outfile, changes, diff, (dlib, dlib1), colvariants, css=css)
+        return [outfile]
+    if unique:
+        with stage('uniqueDesigns', constructs=len(dlib)):
+            dlib = OrderedDict( uniqueDesigns(dlib, dlib1) )
+        libs = list(dlib)
+    else:
+        libs = sorted(dlib)
     slot = 100
     cell = 50
-    i = 1
-    w = cell
-    for libi in sorted(dlib):
-        try:
-            constructid = dlib1[libi]
-        except:
-            constructid = libi
-        parts = addNewConstruct(dwg, constructid, construct=dlib[libi], base=(2*i+0.5)*slot,
-                                cell=cell, slot=slot, dlibid=dlib1, cmap=ncmap, cv=colvariants)
-        i += 1
-        for pc in parts:
-            for p in pc.part:
-                dwg.add( p )
-        w = max(w, pc.x+pc.width)                         
-    dwg.viewbox(width=w+cell, height=slot*(2*i+0.5))
-    dwg.save()
+    constructs = [(i+1, libi, dlib[libi]) for i, libi in enumerate(libs)]
+    with stage('layout', constructs=len(constructs)) as st:
+        table, labels = layoutLibrary(constructs, dlib1, cv=colvariants, cell=cell, slot=slot)
+        st.counts['elements'] = len(table)
+    if perpage is None:
+        perpage = max(1, len(constructs))
+        pagefiles = False
+    else:
+        pagefiles = True
+    pdf = None
+    if pdfile is not None:
+        pdf = PdfCanvas(pdfile)
+    pool = None
+    if jobs > 1 and pdf is None:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=initWorker,
+                                   initargs=(labels, symbols, css))
+    outfiles = []
+    try:
+        for n in range(0, max(1, int(math.ceil( len(constructs) / float(perpage) )))):
+            if pagefiles:
+                pagefile = '{}_p{:03d}.svg'.format(os.path.splitext(outfile)[0], n+1)
+            else:
+                pagefile = outfile
+            first = n*perpage
+            page = [(i-first, libi, construct) for i, libi, construct in constructs[first:(first+perpage)]]
+            lo, hi = np.searchsorted(table['construct'], [first+1, first+perpage+1])
+            ptable = table[lo:hi].copy()
+            # Positions restart on each page
+            ptable['construct'] -= first
+            ptable['y'] -= 2*first*slot
+            ptable['y2'][ptable['type'] == PLINE] -= 2*first*slot
+            with stage('writeSvg', constructs=len(page), elements=len(ptable)):
+                writeSvg(pagefile, page, ptable, labels, symbols=symbols, stream=stream, pool=pool,
+                         jobs=jobs, cell=cell, slot=slot, pdf=pdf, cache=cache, dedup=dedup, css=css)
+            outfiles.append( pagefile )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if pdf is not None:
+        with stage('pdf.save', pages=len(outfiles)):
+            pdf.save()
+    if png is not None:
+        with stage('thumbnail', constructs=len(constructs)):
+            thumbnail(table, labels, png, pngsize[0], pngsize[1], pngfirst, cell=cell, slot=slot)
+    if html is not None:
+        with stage('writeHtml', constructs=len(constructs)):
+            writeHtml(html, table, labels, cell=cell, slot=slot,
+                      title=os.path.splitext(os.path.basename(html))[0])
+    return outfiles
+
+
+def libraryId(sbcid):
+    """ Identifier of a construct of the .j0 file """
+    try:
+        sbcid = str(int(re.sub('SBC', '', sbcid)))
+    except:
+        pass
+    return sbcid
+
+
+def libraryEntry(l, abbvr=False):
+    """ Identifier and parts of a line of the .j0 file """
+    m = l.rstrip().split('\t')
+    sbcid = libraryId(m[0])
+    mm = []
+    for x in m:
+        if abbvr:
+            x = re.sub('plasmid', 'l', x)
+            x = re.sub('promoter', 'p', x)
+            x = re.sub('gene', 'g', x)
+        mm.append(x)
+    return sbcid, mm[1:]
+
+
+def iterLibrary(infoFile, abbvr=False):
+    """ Constructs of the .j0 file as (identifier, parts), one line at a time """
+    with open(infoFile) as h:
+        for l in h:
+            yield libraryEntry(l, abbvr)
 
 
 def readLibrary(infoFile, abbvr=False):
     dlib = {}
-    for l in open(infoFile):
-        m = l.rstrip().split('\t')
-        sbcid = m[0]
-        try:
-            sbcid = str(int(re.sub('SBC', '', sbcid)))
-        except:
-            pass
-        mm = []
-        for x in m:
-            if abbvr:
-                x = re.sub('plasmid', 'l', x)
-                x = re.sub('promoter', 'p', x)
-                x = re.sub('gene', 'g', x)
-            mm.append(x)
-        dlib[sbcid] = mm[1:]
+    for sbcid, parts in iterLibrary(infoFile, abbvr):
+        dlib[sbcid] = parts
     return dlib
 
+
+class LibraryIndex:
+    """ Read-only dict of the constructs of a .j0 file left on disk: only the
+    sorted identifiers and the offsets of their lines are kept in memory, and
+    each construct is parsed when it is looked up. Iterates in sorted order. """
+    def __init__(self, infoFile, abbvr=False, chunk=100000):
+        self.infoFile = infoFile
+        self.abbvr = abbvr
+        self.handle = None
+        keys, offsets = [], []
+        block, starts = [], []
+        pos = 0
+        with open(infoFile, 'rb') as h:
+            for l in h:
+                block.append( libraryId(l.split(b'\t', 1)[0].rstrip().decode()).encode() )
+                starts.append( pos )
+                pos += len(l)
+                if len(block) == chunk:
+                    keys.append( np.array(block, dtype=bytes) )
+                    offsets.append( np.array(starts, dtype=np.int64) )
+                    block, starts = [], []
+        keys.append( np.array(block, dtype=bytes) )
+        offsets.append( np.array(starts, dtype=np.int64) )
+        keys = np.concatenate( keys )
+        offsets = np.concatenate( offsets )
+        order = np.argsort(keys, kind='stable')
+        keys, offsets = keys[order], offsets[order]
+        # As in a dict, the last line of an identifier wins
+        last = np.ones(len(keys), dtype=bool)
+        last[:-1] = keys[1:] != keys[:-1]
+        self.keys, self.offsets = keys[last], offsets[last]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, key):
+        k = np.searchsorted(self.keys, key.encode())
+        if k < len(self.keys) and self.keys[k] == key.encode():
+            return k
+        return None
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+    def __getitem__(self, key):
+        k = self.find(key)
+        if k is None:
+            raise KeyError(key)
+        return self.entry(k)[1]
+
+    def entry(self, k):
+        """ Identifier and parts of the k-th construct in sorted order """
+        if self.handle is None:
+            self.handle = open(self.infoFile, 'rb')
+        self.handle.seek( self.offsets[k] )
+        return libraryEntry(self.handle.readline().decode(), self.abbvr)
+
+    def __iter__(self):
+        return (key.decode() for key in self.keys)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+def fixedFields(line, start=0, width=16):
+    """ Split a fixed-width line into its stripped fields """
+    return [line[i:(i+width)].strip() for i in range(start, len(line), width)]
+
+
 def mapLibrary(dlib, equiv):
     """ Get the ids of each part. """
     eqlib = {}
+    l = 16
     for line in open(equiv):
-        construct = []
         line = line.rstrip()
         ids = line.split()
         plasmid = ids[0]
-        l = 16
-        ll = len(ids[1])
         entry = str('{:>'+str(l)+'}').format(ids[1])
-        for i in range(0, len(line)):
-            if line[i:(i+l)] == entry:
-                break
-#        for i in range(0, len(line)):
-#            if line[i:(i+ll)] == ids[1]:
-#                break
-        while i < len(line):
-            construct.append( line[i:(i+l)].rstrip().lstrip() )
-            i += l
-        for j in range(0, len(dlib[plasmid])):
-            try:
-                if construct[j] == '':
-                    construct[j] = 'None'
-                if dlib[plasmid][j] in eqlib and construct[j] == 'None':
-                    # do not update if it is not empty (see comment below)
-                    continue
-                eqlib[dlib[plasmid][j]] = construct[j]
-            except:
-                # This can happen because some parts are removed
-                # in one of the constructs, prioritize assigning 
-                # a value if somewhere happens in the library
-                if dlib[plasmid][j] not in eqlib:
-                    eqlib[dlib[plasmid][j]] = 'None'
-            
+        # First field of the first id: an earlier occurrence of the id may be
+        # anywhere in the line, so the offset of the previous line is not reused
+        i = line.find(entry)
+        if i < 0:
+            i = len(line) - 1
+        construct = fixedFields(line, i, l)
+        parts = dlib[plasmid]
+        n = min(len(parts), len(construct))
+        for j in range(0, n):
+            pid = construct[j] or 'None'
+            if pid == 'None' and parts[j] in eqlib:
+                # do not update if it is not empty (see comment below)
+                continue
+            eqlib[parts[j]] = pid
+        for p in parts[n:]:
+            # This can happen because some parts are removed
+            # in one of the constructs, prioritize assigning 
+            # a value if somewhere happens in the library
+            if p not in eqlib:
+                eqlib[p] = 'None'
     return eqlib
 
 
+# DoE spreadsheets: part tokens and ICE numbers read directly from .csv/.xlsx
+SHEETS = ('.csv', '.xlsx', '.xlsm')
+TOKEN = r'^([^\d_]*)(\d*)_(\d+)$'
 
-def makeReport(pdfile, design='SBC', size=10):
-    texfile = re.sub('\.pdf$', '_report.tex', pdfile)
+
+def readSheets(filename, count=1):
+    """ Cells (DataFrames of strings, '' if empty) of the first count sheets
+    of the workbook, or of the .csv file, each read in one go """
+    import pandas as pd
+    if filename.endswith('.csv'):
+        try:
+            sheets = [pd.read_csv(filename, header=None, dtype=str, keep_default_na=False)]
+        except pd.errors.ParserError:
+            # Ragged rows longer than the first one
+            with open(filename, newline='') as h:
+                sheets = [pd.DataFrame(list(csv.reader(h))).fillna('')]
+    else:
+        book = pd.read_excel(filename, sheet_name=None, header=None, dtype=str)
+        sheets = [df.fillna('') for df in list(book.values())[:count]]
+    return [df.apply(lambda c: c.str.strip()) for df in sheets]
+
+
+def sheetRows(df, pattern=None):
+    """ Identifiers and cells of the rows of the sheet, without a header row
+    (a first row with no cell matching the pattern, if any) """
+    cells = df.iloc[:, 1:]
+    if pattern is not None and len(df) > 0 and not cells.iloc[0].str.match(pattern).any():
+        df, cells = df.iloc[1:], cells.iloc[1:]
+    ids = df.iloc[:, 0]
+    # Same identifiers as libraryId: SBC000123 -> 123
+    num = ids.str.replace('SBC', '', regex=False)
+    num = num.where( num.str.fullmatch(r'\s*[+-]?\d+\s*') )
+    ids = num.dropna().astype(int).astype(str).reindex(ids.index).fillna(ids)
+    return ids.to_numpy(dtype=object), cells.to_numpy(dtype=object)
+
+
+def absentTokens(tokens):
+    """ Mask of the tokens left out of the ICE rows: promoters above 3 of level 3 or more """
+    import pandas as pd
+    u, inv = np.unique(tokens.astype(str), return_inverse=True)
+    parts = pd.Series(u).str.extract(TOKEN)
+    number = pd.to_numeric(parts[1], errors='coerce').fillna(0).to_numpy()
+    level = pd.to_numeric(parts[2], errors='coerce').fillna(0).to_numpy()
+    absent = parts[0].str.startswith('promoter', na=False).to_numpy() & (number > 3) & (level >= 3)
+    return absent[inv.reshape(tokens.shape)]
+
+
+def sheetLibrary(doeFile, iceFile=None, v2=False):
+    """ Library (dlib, dlib1) of a DoE spreadsheet. The cells are either
+    "identifier:token", or tokens with their ICE numbers in the ICE sheet:
+    iceFile, or else the second sheet of the workbook. ICE rows are matched to
+    the constructs by identifier, and their cells by position; with v2, as in
+    readExample, they leave out the promoters above 3 of level 3 or more.
+    Parts with no ICE number are 'None'. """
+    sheets = readSheets(doeFile, 1 if iceFile is not None else 2)
+    ids, tokens = sheetRows(sheets[0], r'[^:]*:|' + TOKEN)
+    if tokens.size and all(':' in c for c in tokens[0] if c):
+        # Single sheet of "identifier:token" cells
+        split = np.char.partition(tokens.astype(str), ':')
+        pids, tokens = split[..., 0].astype(object), split[..., 2].astype(object)
+    elif iceFile is not None or len(sheets) > 1:
+        ice = readSheets(iceFile)[0] if iceFile is not None else sheets[1]
+        iceids, cells = sheetRows(ice)
+        # Last row of each construct, as in a dict (a header row matches none)
+        row = dict( zip(iceids, range(len(iceids))) )
+        match = np.array([row.get(i, -1) for i in ids], dtype=int)
+        width = max(tokens.shape[1], cells.shape[1])
+        cells = np.hstack([cells, np.full((cells.shape[0], width-cells.shape[1]), '', dtype=object)])
+        cells = np.vstack([cells, np.full((1, width), '', dtype=object)])[match]
+        if not v2:
+            pids = cells[:, :tokens.shape[1]]
+        else:
+            listed = (tokens != '') & ~absentTokens(tokens)
+            k = np.cumsum(listed, axis=1) - 1
+            pids = np.take_along_axis(cells, np.clip(k, 0, width-1), axis=1)
+            pids[~listed | (k >= width)] = ''
+    else:
+        pids = np.full(tokens.shape, '', dtype=object)
+    dlib = OrderedDict()
+    for cid, parts in zip(ids, tokens.tolist()):
+        dlib[cid] = [p for p in parts if p]
+    # ICE number of each token: the last one given in the library, else 'None'
+    present = tokens != ''
+    flat, flatid = tokens[present], pids[present]
+    dlib1 = dict.fromkeys( flat.tolist(), 'None' )
+    given = flatid != ''
+    dlib1.update( zip(flat[given].tolist(), flatid[given].tolist()) )
+    return dlib, dlib1
+
+
+def fileHash(filename):
+    h = hashlib.sha1()
+    with open(filename, 'rb') as handler:
+        for block in iter(lambda: handler.read(2**20), b''):
+            h.update( block )
+    return h.hexdigest()
+
+
+class LibraryCache:
+    """ Parsed .j0/.ji0 libraries stored as NumPy columns, one .npy file each,
+    memory-mapped when loaded. Part tokens are integer codes into the token
+    column and the constructs are ragged rows given by their offsets. An entry
+    is valid while its source files are unchanged: same size and mtime, or
+    else same content. """
+    COLUMNS = ('ids', 'offsets', 'codes', 'tokens', 'keys', 'values', 'none')
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(cacheFolder(), 'libraries')
+        self.path = path
+        self.version = codeVersion()
+
+    def folder(self, sources):
+        key = '\0'.join(os.path.abspath(f) for f in sources)
+        name = os.path.splitext(os.path.basename(sources[0]))[0]
+        return os.path.join(self.path, name + '-' + hashlib.sha1(key.encode()).hexdigest()[:16])
+
+    def valid(self, folder, sources):
+        """ Check the sources against the stored signature, refreshing the
+        mtimes of files touched without changes """
+        try:
+            with open(os.path.join(folder, 'meta.json')) as h:
+                meta = json.load(h)
+        except (OSError, ValueError):
+            return False
+        if meta.get('version') != self.version or len(meta['sources']) != len(sources):
+            return False
+        touched = False
+        for entry, f in zip(meta['sources'], sources):
+            st = os.stat(f)
+            if entry['size'] != st.st_size:
+                return False
+            if entry['mtime'] != st.st_mtime_ns:
+                if entry['sha1'] != fileHash(f):
+                    return False
+                entry['mtime'] = st.st_mtime_ns
+                touched = True
+        if touched:
+            self.writeMeta(folder, meta)
+        return True
+
+    def writeMeta(self, folder, meta):
+        tmp = os.path.join(folder, 'meta.json.{}.tmp'.format(os.getpid()))
+        with open(tmp, 'w') as h:
+            json.dump(meta, h)
+        os.replace(tmp, os.path.join(folder, 'meta.json'))
+
+    def load(self, sources):
+        """ Library (dlib, dlib1) parsed from the sources, or None if not cached """
+        folder = self.folder(sources)
+        if not self.valid(folder, sources):
+            return None
+        try:
+            col = {c: np.load(os.path.join(folder, c+'.npy'), mmap_mode='r') for c in self.COLUMNS}
+        except (OSError, ValueError):
+            return None
+        tokens = col['tokens'][ col['codes'] ].tolist()
+        offsets = col['offsets'].tolist()
+        dlib = {}
+        for k, cid in enumerate( col['ids'].tolist() ):
+            dlib[cid] = tokens[offsets[k]:offsets[k+1]]
+        values = [None if m else v for v, m in zip(col['values'].tolist(), col['none'].tolist())]
+        dlib1 = dict( zip(col['keys'].tolist(), values) )
+        return dlib, dlib1
+
+    def save(self, sources, dlib, dlib1):
+        """ Store the library parsed from the sources """
+        folder = self.folder(sources)
+        meta = {'version': self.version, 'sources': []}
+        for f in sources:
+            st = os.stat(f)
+            meta['sources'].append( {'file': os.path.abspath(f), 'size': st.st_size,
+                                     'mtime': st.st_mtime_ns, 'sha1': fileHash(f)} )
+        index = {}
+        codes = []
+        offsets = [0]
+        for parts in dlib.values():
+            codes.extend( index.setdefault(p, len(index)) for p in parts )
+            offsets.append( len(codes) )
+        col = {'ids': np.array(list(dlib), dtype=str),
+               'offsets': np.array(offsets, dtype=np.int64),
+               'codes': np.array(codes, dtype=np.int32),
+               'tokens': np.array(list(index), dtype=str),
+               'keys': np.array(list(dlib1), dtype=str),
+               'values': np.array(['' if v is None else v for v in dlib1.values()], dtype=str),
+               'none': np.array([v is None for v in dlib1.values()], dtype=bool)}
+        # Written aside and swapped in, so that readers never see a partial entry.
+        # Saving is best effort: another process may be saving the same library
+        tmp = '{}.{}.tmp'.format(folder, os.getpid())
+        old = None
+        try:
+            os.makedirs(tmp)
+            for c in self.COLUMNS:
+                np.save(os.path.join(tmp, c+'.npy'), col[c])
+            self.writeMeta(tmp, meta)
+            if os.path.exists(folder):
+                old = '{}.{}.old'.format(folder, os.getpid())
+                os.rename(folder, old)
+            os.rename(tmp, folder)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def loadDesign(filename):
+    """ Design matrix from a .npy file (memory-mapped), the first array of a
+    .npz file or a CSV file """
+    if filename.endswith('.npy'):
+        return np.load(filename, mmap_mode='r')
+    if filename.endswith('.npz'):
+        with np.load(filename) as data:
+            return data[data.files[0]]
+    return np.loadtxt(filename, delimiter=',', ndmin=2)
+
+
+class ReportQueue(object):
+    """ LaTeX compilation of the reports in the background, at most
+    maxjobs pdflatex processes at a time. Completion and errors are
+    reported on stderr. """
+    def __init__(self, maxjobs=2, log=None):
+        self.slots = threading.BoundedSemaphore( maxjobs )
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.log = log
+
+    def submit(self, texfile):
+        job = SimpleNamespace(texfile=texfile, pdf=re.sub(r'\.tex$', '.pdf', texfile),
+                              returncode=None, error=None, time=None,
+                              done=threading.Event())
+        with self.lock:
+            self.jobs.append( job )
+        threading.Thread(target=self.run, args=(job,), daemon=True).start()
+        return job
+
+    def fail(self, texfile, error):
+        """ Record a report that could not be submitted """
+        job = SimpleNamespace(texfile=texfile, pdf=None, returncode=None, error=error,
+                              time=0, done=threading.Event())
+        with self.lock:
+            self.jobs.append( job )
+        self.report( job )
+        job.done.set()
+        return job
+
+    def run(self, job):
+        with self.slots:
+            t0 = time.time()
+            try:
+                p = subprocess.run( ['pdflatex', '-interaction=nonstopmode', '-halt-on-error',
+                                     os.path.basename(job.texfile)],
+                                    cwd=os.path.dirname(job.texfile) or '.',
+                                    stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, universal_newlines=True )
+                job.returncode = p.returncode
+                if p.returncode != 0:
+                    errors = [l for l in p.stdout.splitlines() if l.startswith('!')]
+                    job.error = ' '.join(errors) or 'pdflatex exited with {}'.format(p.returncode)
+            except OSError as e:
+                job.error = str(e)
+            job.time = time.time() - t0
+        self.report( job )
+        job.done.set()
+
+    def report(self, job):
+        log = self.log or sys.stderr
+        with self.lock:
+            if job.error is None:
+                log.write( 'Report {} done in {:.1f}s\n'.format(job.pdf, job.time) )
+            else:
+                log.write( 'Report {} failed: {}\n'.format(job.texfile, job.error) )
+            log.flush()
+
+    def wait(self, timeout=None):
+        """ Block until the submitted reports are done and return them; the
+        reports not done before the timeout are kept in the queue """
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.done.wait(timeout)
+        done = [job for job in jobs if job.done.is_set()]
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job not in done]
+        return done
+
+
+reports = {}
+
+def reportQueue(maxjobs=2):
+    """ ReportQueue shared by the runs of this process """
+    if maxjobs not in reports:
+        reports[maxjobs] = ReportQueue(maxjobs)
+    return reports[maxjobs]
+
+
+def waitReports():
+    """ Wait for the reports queued by the runs of this process: their
+    compilation threads do not outlive the interpreter """
+    for queue in list(reports.values()):
+        queue.wait()
+
+
+def makeReport(pdfile, design='SBC', size=10, pages=None, queue=None):
+    """ Write the LaTeX report and queue its compilation. If the number of pages of a
+    paginated PDF is given, each page is included whole. """
+    texfile = re.sub(r'\.pdf$', '_report.tex', pdfile)
     mask = {'design': design, 'comment': 'Library size={}'.format(size)}
     with open('template.tex') as handler, open(texfile, 'w') as h2:
         for line in handler:
             for x in mask:
                 line = re.sub('{{'+x+'}}', mask[x], line)
-            if line.startswith('\end{document}'):
-                for i in range(0, 1+size / 10):
+            if line.startswith(r'\end{document}') and pages is not None:
+                for i in range(0, pages):
+                    tx = '\\includegraphics[width=\\textwidth, height=\\textheight, keepaspectratio, page={page}]{{{pdf}}}\n'
+                    h2.write(tx.format(page=i+1,
+                                       pdf=os.path.basename(pdfile)))
+            elif line.startswith(r'\end{document}'):
+                for i in range(0, 1+size // 10):
                     d = ((10 - size) % 10 ) % 10
-                    y1 = max(0, 1500*( (size/10) - i ) - d * 1500/10)
+                    y1 = max(0, 1500*( (size//10) - i ) - d * 1500//10)
                     y2 = 1500*i
                     tx = '\\includegraphics[width=\\textwidth, trim={{ 0 {y1} 0 {y2} }}, clip]{{{pdf}}}\n'
                     h2.write(tx.format(y1=y1,
                                        y2=y2,
                                        pdf=os.path.basename(pdfile)))
             h2.write( line )
-    p = subprocess.Popen( ['pdflatex', os.path.abspath(texfile)], cwd=os.path.dirname( pdfile ) )
+    if queue is None:
+        queue = reportQueue()
+    return queue.submit( texfile )
             
 def makePDF(outfile, outpdfile):
-    drawing = svg2rlg(outfile)
-    renderPDF.drawToFile(drawing, outpdfile)
+    """ Convert the SVG to PDF; a list of SVG pages gives a multi-page PDF """
+    from reportlab.graphics import renderPDF
+    from reportlab.pdfgen import canvas
+    from svglib.svglib import svg2rlg
+    if isinstance(outfile, (list, tuple)):
+        c = canvas.Canvas(outpdfile)
+        for svgfile in outfile:
+            drawing = svg2rlg(svgfile)
+            c.setPageSize( (drawing.width, drawing.height) )
+            renderPDF.draw(drawing, c, 0, 0)
+            c.showPage()
+        c.save()
+    else:
+        drawing = svg2rlg(outfile)
+        renderPDF.drawToFile(drawing, outpdfile)
+
+
+def positiveInt(value):
+    """ argparse type of the counts that must be at least 1 """
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError('{} is not a positive integer'.format(value))
+    return n
 
 
 def arguments():
     parser = argparse.ArgumentParser(description='Visual DoE. Pablo Carbonell, SYNBIOCHEM, 2018')
     parser.add_argument('doeFile', 
-                        help='Input DoE file')
+                        help='Input DoE file (.j0, .csv/.xlsx sheet, or design matrix, .npy/.npz)')
     parser.add_argument('-i', default=None, 
-                        help='Input DoE file with ICE number')
+                        help='Input DoE file with ICE number (.csv/.xlsx sheet; default: '
+                        'second sheet of the .xlsx DoE file)')
     parser.add_argument('-O',  default=None,
                         help='Output folder (default: same as input)')
     parser.add_argument('-p', action='store_false',
@@ -536,6 +2885,56 @@ def arguments():
                         help='Add extension to output files')
     parser.add_argument('-v2', action='store_true',
                         help='Use new version with txt file (still not working)')
+    parser.add_argument('--symbols', action='store_true',
+                        help='Define each glyph once and place it with <use>')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the library from the input files to the SVG in chunks of constructs, '
+                        'without validation (bounded memory)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of processes rendering the constructs')
+    parser.add_argument('--per-page', type=positiveInt, default=None,
+                        help='Constructs per page (one SVG per page and a multi-page PDF)')
+    parser.add_argument('--native-pdf', action='store_true',
+                        help='Draw the PDF directly instead of converting the SVG')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Draw identical constructs once and reference them')
+    parser.add_argument('--unique', action='store_true',
+                        help='Draw only the distinct designs, with their counts')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use the caches of parsed libraries and rendered constructs')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Cache folder (default: ~/.cache/viscad)')
+    parser.add_argument('--cache-size', type=int, default=500,
+                        help='Maximum size of the cache in MB')
+    parser.add_argument('--report-jobs', type=int, default=2,
+                        help='Maximum number of reports compiled at the same time')
+    parser.add_argument('--wait', action='store_true',
+                        help='Fail if the report does not compile (a command line run '
+                        'always waits for its report before exiting)')
+    parser.add_argument('--png', action='store_true',
+                        help='Write a PNG thumbnail of the library')
+    parser.add_argument('--png-width', type=int, default=256,
+                        help='Width of the thumbnail in pixels')
+    parser.add_argument('--png-height', type=int, default=256,
+                        help='Maximum height of the thumbnail in pixels')
+    parser.add_argument('--png-first', type=int, default=None,
+                        help='Show only the first constructs in the thumbnail')
+    parser.add_argument('--html', action='store_true',
+                        help='Write an interactive HTML viewer of the library')
+    parser.add_argument('--summary', type=positiveInt, nargs='?', const=20, default=None, metavar='K',
+                        help='Draw a summary of the library instead: heatmaps of the part usage and '
+                        'co-occurrence next to a sample of K constructs (default: 20)')
+    parser.add_argument('--diff', default=None, metavar='OLD',
+                        help='Draw only the changes from this previous version of the library '
+                        '(DoE file or design matrix)')
+    parser.add_argument('--diff-match', default='id', choices=['id', 'sequence'],
+                        help='Match the constructs of both versions by identifier or by part sequence')
+    parser.add_argument('--css', action='store_true',
+                        help='Style the parts with the classes of a single style sheet')
+    parser.add_argument('--profile', default=None,
+                        help='Write the time, memory and counts of each stage to this JSON file')
+    parser.add_argument('--profile-stage', default=None,
+                        help='Run this stage under cProfile (stats written next to the profile, .prof)')
     return parser
 
 
@@ -545,36 +2944,463 @@ def runViscad(args=None):
         arg = parser.parse_args()
     else:
         arg = parser.parse_args(args)
-    name = re.sub( '\.[^.]+$', '', os.path.basename(arg.doeFile) )
+    if arg.profile is None:
+        return renderLibrary(arg, args)
+    with Profiler(memory=True, cprofile=arg.profile_stage) as profiler:
+        out = renderLibrary(arg, args)
+    profiler.save( arg.profile )
+    out['profile'] = arg.profile
+    return out
+
+
+def outputFiles(arg):
+    """ SVG and PDF files written for the parsed arguments of runViscad """
+    name = re.sub( r'\.[^.]+$', '', os.path.basename(arg.doeFile) )
     if arg.O is not None:
-        outfile = os.path.join(arg.O, name+arg.x+'.svg')
-        outpdfile = os.path.join(arg.O, name+arg.x+'.pdf')
+        folder = arg.O
     else:
-        outfile = os.path.join(os.path.dirname(arg.doeFile), name+arg.x+'.svg')
-        outpdfile = os.path.join(os.path.dirname(arg.doeFile), name+arg.x+'.pdf')
+        folder = os.path.dirname(arg.doeFile)
+    return os.path.join(folder, name+arg.x+'.svg'), os.path.join(folder, name+arg.x+'.pdf')
+
+
+def expectedOutputs(arg):
+    """ Files written by runViscad for the parsed arguments, as in its result:
+    the SVG (or its first page with --per-page), the PDF, and the PNG and HTML
+    if requested (not drawn with --summary or --diff) """
+    svg, pdf = outputFiles(arg)
+    name = os.path.splitext(svg)[0]
+    single = arg.summary is None and arg.diff is None
+    out = {'svg': [name+'_p001.svg' if arg.per_page is not None and single else svg],
+           'pdf': pdf if arg.p else None}
+    if arg.png and single:
+        out['png'] = name+'.png'
+    if arg.html and single:
+        out['html'] = name+'.html'
+    return out
+
+
+def renderLibrary(arg, args=None):
+    """ Render the library with the parsed arguments of runViscad """
+    outfile, outpdfile = outputFiles(arg)
     try:
         v2 = arg.v2
     except:
         v2 = False
 
-    createnewCad(f1=arg.doeFile, f2=arg.i, outfile=outfile, v2=v2)
+    if arg.p and arg.native_pdf and arg.summary is None and arg.diff is None:
+        pdfile = outpdfile
+    else:
+        pdfile = None
+    if arg.no_cache:
+        cache = None
+        libcache = None
+    else:
+        cache = openCache(arg.cache_dir, arg.cache_size*2**20)
+        libcache = LibraryCache(None if arg.cache_dir is None else os.path.join(arg.cache_dir, 'libraries'))
+    if arg.doeFile.endswith(('.npy', '.npz')):
+        M = arg.doeFile
+    else:
+        M = None
+    if arg.diff is not None:
+        if arg.diff.endswith(('.npy', '.npz')):
+            diff = arg.diff
+        else:
+            diff = readConstructs(arg.diff, libcache=libcache)
+    else:
+        diff = None
+    if arg.png:
+        png = os.path.splitext(outfile)[0]+'.png'
+    else:
+        png = None
+    if arg.html:
+        html = os.path.splitext(outfile)[0]+'.html'
+    else:
+        html = None
+    outfiles = createnewCad(f1=arg.doeFile, f2=arg.i, outfile=outfile, v2=v2, symbols=arg.symbols,
+                            stream=arg.stream, jobs=arg.jobs, perpage=arg.per_page, pdfile=pdfile,
+                            cache=cache, dedup=arg.dedup, unique=arg.unique, png=png,
+                            pngsize=(arg.png_width, arg.png_height), pngfirst=arg.png_first,
+                            html=html, M=M, libcache=libcache, summary=arg.summary,
+                            diff=diff, match=arg.diff_match, css=arg.css)
     if arg.p:
-        makePDF(outfile, outpdfile)
-        if arg.r:
-            try:
-                makeReport( outpdfile, arg.d, int(arg.s) )
-            except:
-                pass
-            
+        if arg.per_page is None:
+            pages = None
+        else:
+            pages = len(outfiles)
+        if pdfile is None:
+            with stage('makePDF', pages=len(outfiles)):
+                if pages is None:
+                    makePDF(outfile, outpdfile)
+                else:
+                    makePDF(outfiles, outpdfile)
+    job = None
+    if arg.p and arg.r:
+        queue = reportQueue( arg.report_jobs )
+        try:
+            with stage('makeReport'):
+                job = makeReport( outpdfile, arg.d or 'SBC', int(arg.s or 10), pages=pages, queue=queue )
+        except Exception as e:
+            job = queue.fail( re.sub(r'\.pdf$', '_report.tex', outpdfile),
+                              '{}: {}'.format(type(e).__name__, e) )
+        if arg.wait:
+            with stage('pdflatex'):
+                job.done.wait()
+            if job.error is not None:
+                raise RuntimeError( 'Report failed: {}'.format(job.error) )
+
     if arg.l is not None:
         with open(arg.l, 'a') as handler:
             if args is None:
                 handler.write(' '.join(['"{}"'.format(x) for x in sys.argv])+'\n')
             else:
                 handler.write('"viscad.py"'+' '.join(['"{}"'.format(x) for x in args])+'\n')
+    out = {'svg': outfiles, 'pdf': None}
+    if png is not None:
+        out['png'] = png
+    if html is not None:
+        out['html'] = html
+    if arg.p:
+        out['pdf'] = outpdfile
+    if job is not None:
+        out['report'] = job.pdf
+    return out
+
+
+caches = {}
+
+def openCache(path=None, maxsize=500*2**20):
+    """ RenderCache shared by the runs of this process """
+    if (path, maxsize) not in caches:
+        caches[(path, maxsize)] = RenderCache(path, maxsize)
+    return caches[(path, maxsize)]
+
+
+def jobArguments(job):
+    """ Command line of a render job: {"doeFile": ..., "i": ICE file, "O": output folder,
+    "args": [other viscad.py options]} """
+    args = [job['doeFile']]
+    if job.get('i') is not None:
+        args += ['-i', job['i']]
+    if job.get('O') is not None:
+        args += ['-O', job['O']]
+    return args + list(job.get('args', []))
+
+
+def runJob(job):
+    """ Run a render job in a worker of the server and report outputs and timings """
+    t0 = time.time()
+    c0 = time.process_time()
+    res = {'id': job.get('id')}
+    try:
+        res['outputs'] = runViscad( jobArguments(job) )
+        res['status'] = 'ok'
+    except SystemExit:
+        res['status'] = 'error'
+        res['error'] = 'invalid arguments'
+    except Exception as e:
+        res['status'] = 'error'
+        res['error'] = '{}: {}'.format(type(e).__name__, e)
+    res['time'] = time.time() - t0
+    res['cpu'] = time.process_time() - c0
+    return res
+
+
+def batchJob(job):
+    """ Same as runJob, waiting for the report of the library: the workers of
+    a batch exit with it """
+    try:
+        return runJob(job)
+    finally:
+        waitReports()
+
+
+def serveLines(lines, write, pool, slots):
+    """ Submit each JSON job line to the pool and write each result as a JSON line
+    when it completes. At most slots jobs are pending at any time. """
+    lock = threading.Lock()
+    pending = []
+    def done(future, job, finished):
+        try:
+            res = future.result()
+        except Exception as e:
+            res = {'id': job.get('id'), 'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)}
+        try:
+            with lock:
+                write( json.dumps(res) + '\n' )
+        finally:
+            slots.release()
+            finished.set()
+    for line in lines:
+        if len(line.strip()) == 0:
+            continue
+        try:
+            job = json.loads(line)
+            jobArguments(job)
+        except Exception as e:
+            with lock:
+                write( json.dumps({'status': 'error', 'error': 'invalid job: {}'.format(e)}) + '\n' )
+            continue
+        slots.acquire()
+        finished = threading.Event()
+        future = pool.submit(runJob, job)
+        future.add_done_callback( lambda f, job=job, finished=finished: done(f, job, finished) )
+        pending.append( finished )
+    for finished in pending:
+        finished.wait()
+
+
+def ignoreInterrupt():
+    """ Leave Ctrl-C to the server, which shuts the pool down """
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def serve(args=None):
+    """ Server mode: keep the workers warm and render the jobs read as JSON lines
+    from stdin (or from the clients of a Unix socket) """
+    from concurrent.futures import ProcessPoolExecutor
+    parser = argparse.ArgumentParser(description='Visual DoE server: one JSON render job per line')
+    parser.add_argument('-j', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    parser.add_argument('--socket', default=None,
+                        help='Listen on this Unix socket instead of stdin')
+    arg = parser.parse_args(args)
+    slots = threading.BoundedSemaphore( 2*arg.j )
+    with ProcessPoolExecutor(max_workers=arg.j, initializer=ignoreInterrupt) as pool:
+        if arg.socket is None:
+            def write(text):
+                sys.stdout.write( text )
+                sys.stdout.flush()
+            serveLines(sys.stdin, write, pool, slots)
+        else:
+            import socketserver
+            class Handler(socketserver.StreamRequestHandler):
+                def handle(self):
+                    def write(text):
+                        self.wfile.write( text.encode() )
+                        self.wfile.flush()
+                    serveLines((l.decode() for l in self.rfile), write, pool, slots)
+            if os.path.exists(arg.socket):
+                os.remove(arg.socket)
+            server = socketserver.ThreadingUnixStreamServer(arg.socket, Handler)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+                os.remove(arg.socket)
+
+
+def thumbnailLibrary(doeFile, outfile, width=256, height=256, first=None):
+    """ Write the PNG thumbnail of a library (.j0/.ji0 files, DoE spreadsheet or
+    design matrix, read as in runViscad) without rendering it """
+    M = doeFile if doeFile.endswith(('.npy', '.npz')) else None
+    dlib, dlib1 = readConstructs(doeFile, M)
+    constructs = [(i+1, libi, dlib[libi]) for i, libi in enumerate(sorted(dlib))]
+    table, labels = layoutLibrary(constructs, dlib1)
+    return thumbnail(table, labels, outfile, width, height, first)
+
+
+def thumbnails(args=None):
+    """ Thumbnail mode: PNG thumbnails of many libraries """
+    parser = argparse.ArgumentParser(description='Visual DoE thumbnails')
+    parser.add_argument('doeFile', nargs='+',
+                        help='Input DoE files (.j0, .csv/.xlsx sheet, or design matrix, .npy/.npz)')
+    parser.add_argument('-O', default=None,
+                        help='Output folder (default: same as input)')
+    parser.add_argument('-w', type=int, default=256,
+                        help='Width in pixels')
+    parser.add_argument('--height', type=int, default=256,
+                        help='Maximum height in pixels')
+    parser.add_argument('-n', type=int, default=None,
+                        help='Show only the first constructs')
+    parser.add_argument('-j', type=int, default=1,
+                        help='Number of processes')
+    arg = parser.parse_args(args)
+    jobs = []
+    for doeFile in arg.doeFile:
+        name = re.sub( r'\.[^.]+$', '', os.path.basename(doeFile) )
+        folder = os.path.dirname(doeFile) if arg.O is None else arg.O
+        jobs.append( (doeFile, os.path.join(folder, name+'.png'), arg.w, arg.height, arg.n) )
+    if arg.j > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=arg.j) as pool:
+            outfiles = list( pool.map(thumbnailLibrary, *zip(*jobs)) )
+    else:
+        outfiles = [thumbnailLibrary(*job) for job in jobs]
+    return outfiles
+
+
+# Extensions of the DoE files picked from the folders given to batch (.csv
+# sheets are left out, they can be ICE sheets: give them by name or pattern)
+BATCH = ('.j0', '.txt', '.npy', '.npz', '.xlsx', '.xlsm')
+
+
+def batchFiles(paths):
+    """ DoE files of the folders and glob patterns, each library once """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = [e.path for e in os.scandir(path) if e.is_file() and e.name.endswith(BATCH)]
+        else:
+            found = glob.glob(path) or [path]
+        files.extend( sorted(found) )
+    unique = OrderedDict()
+    for doeFile in files:
+        # name.txt and name.j0 are the same library
+        unique.setdefault( re.sub('.txt$', '.j0', doeFile), doeFile )
+    return list(unique.values())
+
+
+def jobInputs(doeFile):
+    """ Files read to render the DoE file """
+    if doeFile.endswith(('.npy', '.npz') + SHEETS):
+        return [doeFile]
+    f1j0 = re.sub('.txt', '.j0', doeFile)
+    return [f1j0, re.sub('.j0', '.ji0', f1j0)]
+
+
+def inputState(files, check='mtime'):
+    """ Modification time, and hash if check is 'hash', of the existing input files """
+    state = {}
+    for f in files:
+        if os.path.exists(f):
+            state[f] = {'mtime': os.path.getmtime(f)}
+            if check == 'hash':
+                state[f]['sha1'] = fileHash(f)
+    return state
+
+
+def upToDate(entry, previous, outputs, check='mtime'):
+    """ Whether the outputs of the job entry are newer than its inputs (mtime), or
+    were made from the same inputs (hash), with the same options as in the
+    previous manifest entry, if any """
+    if not all(os.path.exists(f) for f in outputs):
+        return False
+    if previous is None:
+        if check == 'hash':
+            return False
+    elif previous.get('status') not in ('ok', 'skipped') or previous.get('args') != entry['args']:
+        return False
+    if check == 'hash':
+        state = lambda s: dict( (f, v.get('sha1')) for f, v in s.items() )
+        return state(previous.get('inputs', {})) == state(entry['inputs'])
+    newest = max([v['mtime'] for v in entry['inputs'].values()] + [0])
+    return min(os.path.getmtime(f) for f in outputs) >= newest
+
+
+def batch(args=None):
+    """ Batch mode: render the DoE files of folders or glob patterns in parallel,
+    skipping the ones that are up to date, and write a JSON manifest.
+    Options after -- are passed to every library. Returns the manifest, where
+    errors counts the libraries of this batch that failed. """
+    args = list(sys.argv[1:] if args is None else args)
+    if '--' in args:
+        extra = args[args.index('--')+1:]
+        args = args[:args.index('--')]
+    else:
+        extra = []
+    parser = argparse.ArgumentParser(description='Visual DoE batch rendering',
+                                     usage='%(prog)s [options] path [path ...] [-- viscad.py options]')
+    parser.add_argument('path', nargs='+',
+                        help='DoE files, folders or glob patterns')
+    parser.add_argument('-O', default=None,
+                        help='Output folder (default: same as input)')
+    parser.add_argument('-j', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    parser.add_argument('--check', default='mtime', choices=['mtime', 'hash'],
+                        help='Compare inputs and outputs by modification time or by content hash')
+    parser.add_argument('--force', action='store_true',
+                        help='Render every library, even if it is up to date')
+    parser.add_argument('--manifest', default=None,
+                        help='JSON manifest (default: manifest.json in the output folder, or here)')
+    arg = parser.parse_args(args)
+    if arg.O is not None:
+        os.makedirs(arg.O, exist_ok=True)
+    manifest = arg.manifest or os.path.join(arg.O or '.', 'manifest.json')
+    previous = {}
+    if os.path.exists(manifest):
+        try:
+            with open(manifest) as h:
+                previous = dict( (e['doeFile'], e) for e in json.load(h)['libraries'] )
+        except (ValueError, KeyError, TypeError):
+            previous = {}
+    entries = []
+    jobs = []
+    planned = []
+    writers = {}
+    for doeFile in batchFiles(arg.path):
+        job = {'id': len(entries), 'doeFile': doeFile, 'O': arg.O, 'args': extra}
+        entry = {'doeFile': doeFile, 'args': extra,
+                 'inputs': inputState(jobInputs(doeFile), arg.check)}
+        try:
+            parsed = arguments().parse_args( jobArguments(job) )
+        except SystemExit:
+            entry.update( status='error', error='invalid arguments' )
+            entries.append( entry )
+            continue
+        svg = outputFiles(parsed)[0]
+        planned.append( (job, entry, svg, expectedOutputs(parsed)) )
+        writers.setdefault( os.path.abspath(svg), [] ).append( doeFile )
+        entries.append( entry )
+    for job, entry, svg, outputs in planned:
+        # Libraries of the same name (lib.j0, lib.xlsx) would overwrite each other
+        others = [f for f in writers[os.path.abspath(svg)] if f != entry['doeFile']]
+        files = outputs['svg'] + [f for k, f in outputs.items() if k != 'svg' and f is not None]
+        if others:
+            entry.update( status='error', error='same output {} as {}'.format(svg, ', '.join(others)),
+                          time=0, cpu=0 )
+            sys.stderr.write( '{:>8} {:8.2f}s {}: {}\n'.format('error', 0, entry['doeFile'], entry['error']) )
+        elif not arg.force and upToDate(entry, previous.get(entry['doeFile']), files, arg.check):
+            entry.update( status='skipped', outputs=outputs, time=0, cpu=0 )
+        else:
+            jobs.append( (job, entry) )
+    # Largest libraries first, so that the batch takes about as long as the slowest one
+    jobs.sort( key=lambda je: -sum(os.path.getsize(f) for f in je[1]['inputs']) )
+    t0 = time.time()
+    def finish(entry, res):
+        entry.update( (k, v) for k, v in res.items() if k != 'id' )
+        sys.stderr.write( '{:>8} {:8.2f}s {}\n'.format(entry['status'], entry['time'], entry['doeFile']) )
+    if arg.j > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=min(arg.j, len(jobs)), initializer=ignoreInterrupt) as pool:
+            futures = dict( (pool.submit(batchJob, job), entry) for job, entry in jobs )
+            for future in as_completed(futures):
+                finish( futures[future], future.result() )
+    else:
+        for job, entry in jobs:
+            finish( entry, batchJob(job) )
+    # Libraries of previous batches are kept in the manifest
+    done = set( e['doeFile'] for e in entries )
+    errors = sum(1 for e in entries if e['status'] == 'error')
+    entries += [e for doeFile, e in previous.items() if doeFile not in done]
+    result = {'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'check': arg.check, 'time': time.time() - t0,
+              'rendered': len(jobs), 'errors': errors, 'libraries': entries}
+    folder = os.path.dirname(os.path.abspath(manifest))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    tmp = manifest + '.tmp'
+    with open(tmp, 'w') as h:
+        json.dump(result, h, indent=1)
+    os.replace(tmp, manifest)
+    return result
+
 
 if __name__ == '__main__':
-    runViscad()
+    if sys.argv[1:2] == ['serve']:
+        serve(sys.argv[2:])
+    elif sys.argv[1:2] == ['thumbnails']:
+        thumbnails(sys.argv[2:])
+    elif sys.argv[1:2] == ['batch']:
+        # Only the libraries of this batch, not those kept from previous ones
+        if batch(sys.argv[2:])['errors'] > 0:
+            sys.exit(1)
+    else:
+        try:
+            runViscad()
+        finally:
+            waitReports()
 
 
 #########################